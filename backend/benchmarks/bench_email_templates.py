@@ -0,0 +1,102 @@
+"""
+Email template render benchmark
+Measures per-message render cost for the expiry email, as the expiry job sends it
+to a batch of users: the compiled engine, the inline f-string it replaced, and
+uncached rendering. Names with and without HTML-special characters are timed
+separately, since only the former pay for escaping.
+
+Run from backend/:  python -m benchmarks.bench_email_templates [messages]
+"""
+import html
+import string
+import sys
+import time
+
+from services.email_templates import FRONTEND_URL, EmailTemplateEngine, email_templates
+
+
+def _users(count: int, special: bool = False):
+    return [
+        {"user_name": f"Reader {i} <r{i}@example.com>" if special else f"Reader {i}", "period_text": "Yearly"}
+        for i in range(count)
+    ]
+
+
+def _legacy_expiry_html(user_name: str, period_text: str) -> str:
+    """The expiry email as notifications.py built it before the template engine (no escaping)."""
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+            body {{ font-family: 'Inter', Arial, sans-serif; line-height: 1.6; color: #1a1a1a; }}
+            .container {{ max-width: 600px; margin: 0 auto; padding: 40px 20px; }}
+            .header {{ border-bottom: 2px solid #1a1a1a; padding-bottom: 20px; margin-bottom: 30px; }}
+            .content {{ background: #f9fafb; padding: 32px; border-radius: 8px; }}
+            .highlight {{ background: white; padding: 20px; border-left: 3px solid #dc2626; margin: 20px 0; }}
+            .cta {{ text-align: center; margin: 30px 0; }}
+            .cta-button {{ display: inline-block; background: #1a1a1a; color: white; padding: 14px 28px; text-decoration: none; border-radius: 4px; font-weight: 600; }}
+            .footer {{ text-align: center; margin-top: 40px; font-size: 14px; color: #6b7280; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1 style="font-size: 24px; margin: 0;">Subscription Expired</h1>
+                <p style="margin: 8px 0 0 0; color: #6b7280;">Faith by Experiments</p>
+            </div>
+            <div class="content">
+                <p>Dear {user_name},</p>
+                <p>We wanted to let you know that your {period_text} subscription to Faith by Experiments has expired.</p>
+                <div class="highlight">
+                    <p style="margin: 0;"><strong>Subscription Status:</strong></p>
+                    <p style="margin: 8px 0 0 0;">Plan: {period_text} Subscription</p>
+                    <p style="margin: 8px 0 0 0;">Status: Expired</p>
+                </div>
+                <p>Your access to premium content has been temporarily suspended. To continue your journey of faith through experimentation, please renew your subscription.</p>
+                <div class="cta">
+                    <a href="{FRONTEND_URL}/subscribe" class="cta-button">Renew Subscription</a>
+                </div>
+                <p>If you have any questions or need assistance, please don't hesitate to reach out.</p>
+            </div>
+            <div class="footer">
+                <p>Faith by Experiments<br>Faith, tested in real life.</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+
+def _time(label: str, render, users) -> None:
+    started = time.perf_counter()
+    for user in users:
+        render(user)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<38} {1e6 * elapsed / len(users):8.2f} us/message   {elapsed:7.3f} s total")
+
+
+def main(count: int) -> None:
+    users = _users(count)
+    special_users = _users(count, special=True)
+    compiled = email_templates.get("subscription_expiry")
+    # The same composed HTML, substituted with string.Template on every call
+    composed = string.Template(compiled.render(user_name="$user_name", period_text="$period_text"))
+
+    print(f"Rendering {count} expiry emails")
+    _time("inline f-string (previous code)", lambda u: _legacy_expiry_html(**u), users)
+    _time("compiled engine", lambda u: compiled.render(**u), users)
+    _time("compiled engine, names need escaping", lambda u: compiled.render(**u), special_users)
+    _time(
+        "string.Template per message",
+        lambda u: composed.substitute({k: html.escape(v) for k, v in u.items()}),
+        users,
+    )
+    _time(
+        "load + compile per message",
+        lambda u: EmailTemplateEngine().render("subscription_expiry", **u),
+        users[: max(1, count // 10)],
+    )
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
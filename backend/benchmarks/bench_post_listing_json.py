@@ -0,0 +1,89 @@
+"""
+Post listing serialization benchmark
+Measures the cost of turning a 100-post GET /api/posts page into JSON bytes: FastAPI's
+response_model path through the stdlib JSONResponse and through ORJSONResponse, plus
+the catalog's pre-encoded join and the ?fields= projection with each encoder.
+
+Run from backend/:  python -m benchmarks.bench_post_listing_json [iterations]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from models.post import PostPreviewResponse
+from services.post_cache import PostVariants, encode_listing
+from utils.json_encoding import APIJSONResponse, dumps, orjson
+
+PAGE_SIZE = 100
+PARAGRAPH = (
+    "What if we could approach faith the way a scientist approaches a hypothesis, with "
+    "curiosity, rigor, and openness to revision? Observe the results with honesty. "
+)
+
+
+def _posts(count: int) -> List[dict]:
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    posts = []
+    for i in range(count):
+        created = (started + timedelta(days=i)).isoformat()
+        posts.append({
+            "id": f"post-{i}",
+            "title": f"Experiment {i}: Attention as Prayer",
+            "slug": f"experiment-{i}-attention-as-prayer",
+            "excerpt": PARAGRAPH,
+            "content": PARAGRAPH * 40,
+            "is_premium": i % 2 == 0,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return posts
+
+
+def _time(label: str, render, iterations: int) -> None:
+    size = len(render())
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {1e3 * elapsed / iterations:8.3f} ms/page   {size / 1024:7.1f} KiB")
+
+
+def main(iterations: int) -> None:
+    variants = [PostVariants(post) for post in _posts(PAGE_SIZE)]
+    entries = [entry.full_listing for entry in variants]
+    adapter = TypeAdapter(List[PostPreviewResponse])
+
+    def response_model_path(response_class):
+        # What FastAPI does for a route returning dicts with response_model=List[...]
+        def render():
+            validated = adapter.validate_python(entries)
+            content = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+            return response_class(content).body
+        return render
+
+    fields = ["id", "title", "slug", "created_at"]
+    projected = [{field: entry[field] for field in fields} for entry in entries]
+
+    print(f"Serializing a {PAGE_SIZE}-post listing page, {iterations} iterations")
+    _time("response_model + JSONResponse (stdlib)", response_model_path(JSONResponse), iterations)
+    if orjson is not None:
+        _time("response_model + ORJSONResponse", response_model_path(APIJSONResponse), iterations)
+    else:
+        print("orjson is not installed; skipping the ORJSONResponse path")
+    _time("catalog pre-encoded join", lambda: encode_listing(variants, True), iterations)
+    _time(
+        "?fields= projection, json.dumps",
+        lambda: json.dumps(projected, ensure_ascii=False, separators=(",", ":")).encode(),
+        iterations,
+    )
+    _time("?fields= projection, dumps()", lambda: dumps(projected), iterations)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
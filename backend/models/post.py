@@ -4,6 +4,18 @@ from datetime import datetime, timezone
 import uuid
 import re
 
+# Number of content characters shown to readers without a subscription
+PREVIEW_LENGTH = 500
+# Slugs that would be shadowed by fixed routes under /posts (GET /posts/search)
+RESERVED_SLUGS = frozenset({"search"})
+
+
+def build_preview(content: str) -> str:
+    """Truncate premium content to the preview shown to non-subscribers."""
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH] + "..."
+    return content
+
 
 def generate_slug(title: str) -> str:
     """Generate a URL-friendly slug from a title."""
@@ -71,3 +83,17 @@ class PostPreviewResponse(BaseModel):
     is_premium: bool
     created_at: str
     updated_at: str
+
+
+class PostSearchResult(BaseModel):
+    """A search hit: listing fields plus a highlighted snippet of the visible text"""
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str
+    title: str
+    slug: str
+    excerpt: str
+    is_premium: bool
+    created_at: str
+    snippet: str  # HTML-escaped text with matches wrapped in <mark>
+    score: float
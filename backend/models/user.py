@@ -52,4 +52,9 @@ class UserResponse(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None  # Only issued when subscription claims are enabled
     user: UserResponse
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
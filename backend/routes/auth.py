@@ -1,10 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from typing import Optional
 from datetime import datetime, timezone, timedelta
 
-from models.user import UserCreate, UserLogin, UserInDB, UserResponse, TokenResponse
-from utils.auth import hash_password, verify_password, create_access_token, decode_token
+from models.user import UserCreate, UserLogin, UserInDB, UserResponse, TokenResponse, RefreshRequest
+from utils.auth import (
+    create_access_token,
+    create_refresh_token,
+    decode_token,
+    SUBSCRIPTION_CLAIMS_ENABLED,
+    CLAIMS_TOKEN_EXPIRE_MINUTES,
+)
+from services.auth_cache import token_cache
+from services.password_hashing import password_hasher
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -22,6 +32,22 @@ def get_db() -> AsyncIOMotorDatabase:
     return _db
 
 
+async def ensure_indexes(db) -> None:
+    """Refresh token ids are recorded once when exchanged and dropped when they expire."""
+    await db.used_refresh_tokens.create_index("jti", unique=True)
+    await db.used_refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def revoke_user_tokens(db, user_id: str) -> None:
+    """End every session of a user: tokens carrying an older token_version are rejected."""
+    await db.users.update_one({"id": user_id}, {"$inc": {"token_version": 1}})
+    token_cache.invalidate_user(user_id)
+
+
+def _token_version(user_doc: dict) -> int:
+    return user_doc.get("token_version", 0)
+
+
 def resolve_subscription_end_at(user_doc: dict) -> Optional[str]:
     """Return stored or computed subscription expiry for API responses."""
     if user_doc.get("subscription_end_at"):
@@ -48,23 +74,68 @@ def resolve_subscription_end_at(user_doc: dict) -> Optional[str]:
     return end_date.isoformat()
 
 
-async def get_current_user(
-    authorization: Optional[str] = Header(None)
-) -> Optional[UserResponse]:
-    """Get current user from JWT token."""
+def create_user_access_token(user_doc: dict) -> str:
+    """
+    Create an access token for a user. With subscription claims enabled the token
+    carries the subscription state and expires before the subscription does.
+    """
+    data = {"sub": user_doc["id"], "email": user_doc["email"], "ver": _token_version(user_doc)}
+    if not SUBSCRIPTION_CLAIMS_ENABLED:
+        return create_access_token(data=data)
+    
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=CLAIMS_TOKEN_EXPIRE_MINUTES)
+    is_subscribed = user_doc.get("is_subscribed", False)
+    subscription_end_at = resolve_subscription_end_at(user_doc) if is_subscribed else None
+    if subscription_end_at:
+        end_date = datetime.fromisoformat(subscription_end_at.replace("Z", "+00:00"))
+        if end_date.tzinfo is None:
+            end_date = end_date.replace(tzinfo=timezone.utc)
+        if now < end_date < expires_at:
+            expires_at = end_date
+    
+    data.update({
+        "is_subscribed": is_subscribed,
+        "subscription_type": user_doc.get("subscription_type"),
+        "subscription_end_at": subscription_end_at,
+    })
+    return create_access_token(data=data, expires_delta=expires_at - now)
+
+
+def create_user_refresh_token(user_doc: dict) -> Optional[str]:
+    """Refresh tokens are only issued alongside short-lived claims tokens."""
+    if not SUBSCRIPTION_CLAIMS_ENABLED:
+        return None
+    return create_refresh_token(user_doc["id"], _token_version(user_doc))
+
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Extract the token from an "Authorization: Bearer <token>" header."""
     if not authorization:
         return None
-    
     try:
-        # Extract token from "Bearer <token>"
         scheme, token = authorization.split()
-        if scheme.lower() != "bearer":
-            return None
     except ValueError:
         return None
+    if scheme.lower() != "bearer":
+        return None
+    return token
+
+
+async def get_current_user(
+    authorization: Optional[str] = Header(None)
+) -> Optional[UserResponse]:
+    """Get current user from JWT token."""
+    token = _bearer_token(authorization)
+    if not token:
+        return None
+    
+    cached_user = token_cache.get(token)
+    if cached_user:
+        return cached_user
     
     payload = decode_token(token)
-    if not payload:
+    if not payload or payload.get("typ") == "refresh":
         return None
     
     user_id = payload.get("sub")
@@ -73,10 +144,10 @@ async def get_current_user(
     
     db = get_db()
     user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not user_doc:
+    if not user_doc or payload.get("ver", 0) != _token_version(user_doc):
         return None
     
-    return UserResponse(
+    user = UserResponse(
         id=user_doc["id"],
         email=user_doc["email"],
         name=user_doc["name"],
@@ -85,6 +156,23 @@ async def get_current_user(
         subscription_type=user_doc.get("subscription_type"),
         subscription_end_at=resolve_subscription_end_at(user_doc)
     )
+    token_cache.put(token, user, payload.get("exp"))
+    return user
+
+
+async def is_subscribed_reader(authorization: Optional[str] = Header(None)) -> bool:
+    """
+    Decide premium access for content reads. Uses the token's subscription claim
+    when present, so no user lookup is needed; otherwise falls back to the database.
+    """
+    if SUBSCRIPTION_CLAIMS_ENABLED:
+        token = _bearer_token(authorization)
+        payload = decode_token(token) if token else None
+        if payload and payload.get("typ") != "refresh" and "is_subscribed" in payload:
+            return bool(payload["is_subscribed"])
+    
+    current_user = await get_current_user(authorization)
+    return bool(current_user and current_user.is_subscribed)
 
 
 async def require_auth(
@@ -125,7 +213,7 @@ async def signup(user_data: UserCreate):
     user = UserInDB(
         email=user_data.email,
         name=user_data.name,
-        password_hash=hash_password(user_data.password),
+        password_hash=await password_hasher.hash(user_data.password),
         is_admin=is_admin,
         is_subscribed=False
     )
@@ -138,10 +226,11 @@ async def signup(user_data: UserCreate):
     await db.users.insert_one(user_dict)
     
     # Create token
-    access_token = create_access_token(data={"sub": user.id, "email": user.email})
+    access_token = create_user_access_token(user_dict)
     
     return TokenResponse(
         access_token=access_token,
+        refresh_token=create_user_refresh_token(user_dict),
         user=UserResponse(
             id=user.id,
             email=user.email,
@@ -164,14 +253,56 @@ async def login(credentials: UserLogin):
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(credentials.password, user_doc["password_hash"]):
+    if not await password_hasher.verify(credentials.password, user_doc["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Create token
-    access_token = create_access_token(data={"sub": user_doc["id"], "email": user_doc["email"]})
+    access_token = create_user_access_token(user_doc)
     
     return TokenResponse(
         access_token=access_token,
+        refresh_token=create_user_refresh_token(user_doc),
+        user=UserResponse(
+            id=user_doc["id"],
+            email=user_doc["email"],
+            name=user_doc["name"],
+            is_admin=user_doc.get("is_admin", False),
+            is_subscribed=user_doc.get("is_subscribed", False),
+            subscription_type=user_doc.get("subscription_type"),
+            subscription_end_at=resolve_subscription_end_at(user_doc)
+        )
+    )
+
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_token(request: RefreshRequest):
+    """
+    Exchange a refresh token for a new access token with current subscription claims,
+    and a new refresh token. Each refresh token is accepted once; a replayed one means
+    it leaked, so every session of the user is revoked.
+    """
+    payload = decode_token(request.refresh_token)
+    if not payload or payload.get("typ") != "refresh" or not payload.get("sub") or not payload.get("jti"):
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    
+    db = get_db()
+    user_doc = await db.users.find_one({"id": payload["sub"]}, {"_id": 0})
+    if not user_doc or payload.get("ver", 0) != _token_version(user_doc):
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    
+    try:
+        await db.used_refresh_tokens.insert_one({
+            "jti": payload["jti"],
+            "user_id": user_doc["id"],
+            "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc),
+        })
+    except DuplicateKeyError:
+        await revoke_user_tokens(db, user_doc["id"])
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    
+    return TokenResponse(
+        access_token=create_user_access_token(user_doc),
+        refresh_token=create_user_refresh_token(user_doc),
         user=UserResponse(
             id=user_doc["id"],
             email=user_doc["email"],
@@ -209,7 +340,7 @@ async def mock_subscribe(
     """Mock subscription endpoint - marks user as subscribed."""
     db = get_db()
     
-    await db.users.update_one(
+    user_doc = await db.users.find_one_and_update(
         {"id": current_user.id},
         {
             "$set": {
@@ -217,6 +348,14 @@ async def mock_subscribe(
                 "subscription_type": "monthly",
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }
-        }
+        },
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
-    return {"message": "Subscription activated", "is_subscribed": True}
+    token_cache.invalidate_user(current_user.id)
+    
+    response = {"message": "Subscription activated", "is_subscribed": True}
+    if SUBSCRIPTION_CLAIMS_ENABLED and user_doc:
+        # The caller's current token still claims no subscription; hand back a fresh one
+        response["access_token"] = create_user_access_token(user_doc)
+    return response
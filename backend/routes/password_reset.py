@@ -7,6 +7,10 @@ import asyncio
 import os
 import resend
 
+from routes.auth import revoke_user_tokens
+from services.email_templates import email_templates
+from services.password_hashing import password_hasher
+
 router = APIRouter(prefix="/password-reset", tags=["Password Reset"])
 
 # Resend API setup
@@ -43,42 +47,7 @@ async def send_reset_email(email: str, token: str, name: str):
     """Send password reset email using Resend."""
     reset_link = f"{FRONTEND_URL}/reset-password?token={token}"
     
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: 'Inter', Arial, sans-serif; line-height: 1.6; color: #1a1a1a; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 40px 20px; }}
-            .header {{ text-align: center; margin-bottom: 40px; }}
-            .content {{ background: #f9fafb; padding: 32px; border-radius: 8px; }}
-            .button {{ display: inline-block; background: #1a1a1a; color: white; padding: 14px 28px; text-decoration: none; border-radius: 6px; margin: 20px 0; }}
-            .footer {{ text-align: center; margin-top: 40px; font-size: 14px; color: #6b7280; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1 style="font-size: 24px; margin: 0;">Faith by Experiments</h1>
-            </div>
-            <div class="content">
-                <p>Hello {name},</p>
-                <p>We received a request to reset your password. Click the button below to create a new password:</p>
-                <p style="text-align: center;">
-                    <a href="{reset_link}" class="button">Reset Password</a>
-                </p>
-                <p>Or copy and paste this link into your browser:</p>
-                <p style="word-break: break-all; font-size: 14px; color: #6b7280;">{reset_link}</p>
-                <p>This link will expire in 1 hour.</p>
-                <p>If you didn't request this password reset, you can safely ignore this email.</p>
-            </div>
-            <div class="footer">
-                <p>Faith by Experiments<br>Faith, tested in real life.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+    html_content = email_templates.render("password_reset", user_name=name, reset_link=reset_link)
     
     params = {
         "from": SENDER_EMAIL,
@@ -161,8 +130,7 @@ async def confirm_password_reset(request: PasswordResetConfirm):
         raise HTTPException(status_code=400, detail="Reset token has expired")
     
     # Hash new password
-    from utils.auth import hash_password
-    new_password_hash = hash_password(request.new_password)
+    new_password_hash = await password_hasher.hash(request.new_password)
     
     # Update user password
     await db.users.update_one(
@@ -174,6 +142,8 @@ async def confirm_password_reset(request: PasswordResetConfirm):
             }
         }
     )
+    # Sessions opened with the old password (possibly by whoever knew it) end here
+    await revoke_user_tokens(db, reset_doc["user_id"])
     
     # Mark token as used
     await db.password_resets.update_one(
@@ -1,15 +1,18 @@
-from fastapi import APIRouter, HTTPException, Header, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Header, Request
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timezone, timedelta
+import asyncio
+import hashlib
 import json
 import os
 import uuid
 
-try:
-    import razorpay
-except ImportError:
-    razorpay = None
+from pymongo import ReturnDocument
+
+from services.job_queue import MongoJobQueue
+from services.payment_gateway import build_payment_gateway
+from utils.signatures import verify_payment_signature, verify_webhook_signature
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
 
@@ -17,16 +20,17 @@ router = APIRouter(prefix="/payments", tags=["Payments"])
 RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID", "").strip()
 RAZORPAY_KEY_SECRET = os.environ.get("RAZORPAY_KEY_SECRET", "").strip()
 RAZORPAY_WEBHOOK_SECRET = os.environ.get("RAZORPAY_WEBHOOK_SECRET", "").strip()
-
-# Check if Razorpay is configured
-RAZORPAY_CONFIGURED = bool(RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET and razorpay)
-
-# Initialize Razorpay client only if configured
-razorpay_client = None
-if RAZORPAY_CONFIGURED:
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-elif not razorpay:
-    print("Razorpay SDK not installed. Run: pip install razorpay")
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "5"))
+# An order left in "fulfilling" longer than this is taken over by the next caller
+FULFILLMENT_LEASE_SECONDS = int(os.environ.get("FULFILLMENT_LEASE_SECONDS", "60"))
+# How long a caller that lost the race waits for the winner before answering 409
+FULFILLMENT_WAIT_SECONDS = float(os.environ.get("FULFILLMENT_WAIT_SECONDS", "10"))
+FULFILLMENT_POLL_SECONDS = 0.1
+
+# Async gateway (Razorpay SDK on a worker pool, or the offline fake); None if not configured
+payment_gateway = build_payment_gateway(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
+RAZORPAY_CONFIGURED = payment_gateway is not None
 
 # Database will be injected from server.py
 _db = None
@@ -97,56 +101,156 @@ def _subscription_update(plan_id: str) -> dict:
     }
 
 
-def _queue_purchase_notification(
-    background_tasks: Optional[BackgroundTasks],
-    order: dict,
-    user_doc: dict,
-) -> None:
-    if not background_tasks:
-        return
-    from services.notifications import send_subscription_purchase_notification
+async def _enqueue_purchase_notification(db, order: dict, user_doc: dict) -> None:
+    """Record the purchase email/SMS in the notification outbox, once per order."""
+    from services.notification_outbox import enqueue_notification
 
     plan = PLANS[order["plan_id"]]
-    amount_str = str(plan["amount"] // 100)
-    background_tasks.add_task(
-        send_subscription_purchase_notification,
-        user_doc.get("name", ""),
-        user_doc.get("email", ""),
-        user_doc.get("mobile"),
-        order["plan_id"],
-        amount_str,
+    await enqueue_notification(
+        db,
+        f"purchase:{order['razorpay_order_id']}",
+        "subscription_purchase",
+        {
+            "user_name": user_doc.get("name", ""),
+            "subscription_type": order["plan_id"],
+            "amount": str(plan["amount"] // 100),
+        },
+        email=user_doc.get("email"),
+        mobile=user_doc.get("mobile"),
     )
 
 
+async def _claim_order_for_fulfillment(db, razorpay_order_id: str) -> Optional[dict]:
+    """
+    Atomically move an order into "fulfilling". Returns the claimed order, or None
+    if another caller already owns (or finished) fulfillment.
+    """
+    now = datetime.now(timezone.utc)
+    return await db.orders.find_one_and_update(
+        {
+            "razorpay_order_id": razorpay_order_id,
+            "$or": [
+                {"status": {"$nin": ["paid", "fulfilling"]}},
+                # Take over from a caller that died mid-fulfillment
+                {"status": "fulfilling", "fulfillment_lease_until": {"$lt": now.isoformat()}},
+            ],
+        },
+        {
+            "$set": {
+                "status": "fulfilling",
+                "fulfillment_lease_until": (
+                    now + timedelta(seconds=FULFILLMENT_LEASE_SECONDS)
+                ).isoformat(),
+            }
+        },
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
+    )
+
+
+class FulfillmentClaimLost(Exception):
+    """The order left "fulfilling" under us, e.g. another caller took over an expired lease."""
+
+
+async def _mark_order_paid(db, razorpay_order_id: str, fields: dict, unset: dict) -> None:
+    """Move a claimed order from "fulfilling" to "paid"; raises if the claim is gone."""
+    result = await db.orders.update_one(
+        {"razorpay_order_id": razorpay_order_id, "status": "fulfilling"},
+        {"$set": {"status": "paid", **fields}, "$unset": unset},
+    )
+    if result.modified_count == 0:
+        raise FulfillmentClaimLost(razorpay_order_id)
+
+
+async def _wait_for_fulfillment(db, razorpay_order_id: str) -> dict:
+    """Wait for a concurrent fulfillment to finish and return the activated user."""
+    deadline = asyncio.get_running_loop().time() + FULFILLMENT_WAIT_SECONDS
+    while True:
+        order = await db.orders.find_one(
+            {"razorpay_order_id": razorpay_order_id},
+            {"_id": 0, "status": 1, "user_id": 1},
+        )
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if order.get("status") == "paid" and order.get("user_id"):
+            return await _get_order_user(db, order["user_id"])
+        if order.get("status") != "fulfilling":
+            # The other caller failed and released the order; let this one retry
+            raise HTTPException(status_code=409, detail="Payment could not be processed, please retry")
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(status_code=409, detail="Payment is still being processed, please retry")
+        await asyncio.sleep(FULFILLMENT_POLL_SECONDS)
+
+
 async def fulfill_paid_order(
     db,
     order: dict,
     razorpay_payment_id: str,
-    background_tasks: Optional[BackgroundTasks] = None,
-) -> str:
+) -> dict:
     """
     Mark order paid and activate subscription. Idempotent — safe to call multiple times.
-    Returns the user_id linked to the order.
+    The order moves created|pending_signup -> fulfilling -> paid with compare-and-set
+    updates, so when /verify and the webhook race exactly one caller does the work
+    and writes the notification outbox; the other waits for it and returns the same user.
+    Returns the user document linked to the order, as it is after activation.
     """
     if order.get("status") == "paid" and order.get("user_id"):
-        return order["user_id"]
+        return await _get_order_user(db, order["user_id"])
+
+    razorpay_order_id = order["razorpay_order_id"]
+    claimed = await _claim_order_for_fulfillment(db, razorpay_order_id)
+    if claimed is None:
+        return await _wait_for_fulfillment(db, razorpay_order_id)
+    if claimed.get("status") == "fulfilling":
+        print(f"Resuming stalled fulfillment for order {razorpay_order_id}")
 
+    try:
+        return await _apply_fulfillment(db, claimed, razorpay_payment_id)
+    except FulfillmentClaimLost:
+        # The order is no longer ours to release; follow whoever owns it now
+        print(f"Lost fulfillment claim for order {razorpay_order_id}; waiting for its new owner")
+        return await _wait_for_fulfillment(db, razorpay_order_id)
+    except Exception:
+        # Release the claim so a retry (webhook or client) can fulfill the order
+        previous_status = claimed.get("status")
+        if previous_status == "fulfilling":
+            previous_status = "pending_signup" if claimed.get("pending_user_data") else "created"
+        await db.orders.update_one(
+            {"razorpay_order_id": razorpay_order_id, "status": "fulfilling"},
+            {
+                "$set": {"status": previous_status},
+                "$unset": {"fulfillment_lease_until": ""},
+            },
+        )
+        raise
+
+
+async def _apply_fulfillment(
+    db,
+    order: dict,
+    razorpay_payment_id: str,
+) -> dict:
+    """Activate the subscription for a claimed order, mark it paid and return the user."""
     plan_id = order["plan_id"]
     subscription_update = _subscription_update(plan_id)
     paid_at = datetime.now(timezone.utc).isoformat()
-    notify = order.get("status") != "paid"
+    from services.auth_cache import token_cache
 
-    if order.get("status") == "pending_signup" and order.get("pending_user_data"):
+    if order.get("pending_user_data"):
         from routes.auth import ADMIN_EMAIL
         from models.user import UserInDB
 
         pending_data = order["pending_user_data"]
-        existing_user = await db.users.find_one({"email": pending_data["email"]}, {"_id": 0})
+        user_doc = await db.users.find_one_and_update(
+            {"email": pending_data["email"]},
+            {"$set": subscription_update},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
 
-        if existing_user:
-            user_id = existing_user["id"]
-            await db.users.update_one({"id": user_id}, {"$set": subscription_update})
-            user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if user_doc:
+            user_id = user_doc["id"]
+            token_cache.invalidate_user(user_id)
         else:
             is_admin = pending_data["email"].lower() == ADMIN_EMAIL.lower()
             user_id = str(uuid.uuid4())
@@ -173,65 +277,65 @@ async def fulfill_paid_order(
             user_dict["subscription_started_at"] = subscription_update["subscription_started_at"]
             user_dict["subscription_end_at"] = subscription_update["subscription_end_at"]
             await db.users.insert_one(user_dict)
+            user_dict.pop("_id", None)
             user_doc = user_dict
 
-        await db.orders.update_one(
-            {"razorpay_order_id": order["razorpay_order_id"]},
-            {
-                "$set": {
-                    "status": "paid",
-                    "user_id": user_id,
-                    "razorpay_payment_id": razorpay_payment_id,
-                    "paid_at": paid_at,
-                },
-                "$unset": {"pending_user_data": ""},
-            },
+        # Outbox entry is written before the order is marked paid, so a takeover after
+        # a crash re-enqueues it (deduplicated) rather than losing it
+        await _enqueue_purchase_notification(db, order, user_doc)
+        await _mark_order_paid(
+            db,
+            order["razorpay_order_id"],
+            {"user_id": user_id, "razorpay_payment_id": razorpay_payment_id, "paid_at": paid_at},
+            {"pending_user_data": "", "fulfillment_lease_until": ""},
         )
-
-        if notify:
-            _queue_purchase_notification(background_tasks, order, user_doc)
-        return user_id
+        return user_doc
 
     user_id = order.get("user_id")
     if not user_id:
         raise HTTPException(status_code=400, detail="Order is missing user information")
 
-    await db.users.update_one({"id": user_id}, {"$set": subscription_update})
-    await db.orders.update_one(
-        {"razorpay_order_id": order["razorpay_order_id"]},
-        {
-            "$set": {
-                "status": "paid",
-                "razorpay_payment_id": razorpay_payment_id,
-                "paid_at": paid_at,
-            }
-        },
+    user_doc = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$set": subscription_update},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
     )
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User account not found for this order")
+    token_cache.invalidate_user(user_id)
+    await _enqueue_purchase_notification(db, order, user_doc)
+    await _mark_order_paid(
+        db,
+        order["razorpay_order_id"],
+        {"razorpay_payment_id": razorpay_payment_id, "paid_at": paid_at},
+        {"fulfillment_lease_until": ""},
+    )
+    return user_doc
 
-    if notify:
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user_doc:
-            _queue_purchase_notification(background_tasks, order, user_doc)
 
-    return user_id
+async def _get_order_user(db, user_id: str) -> dict:
+    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User account not found for this order")
+    return user_doc
 
 
-async def _build_verify_response(
-    db,
+def _build_verify_response(
     order: dict,
-    user_id: str,
+    user_doc: dict,
     *,
     is_signup_order: bool = False,
     already_paid: bool = False,
 ) -> dict:
     """Build the /verify response. Always returns a login token when possible."""
-    from routes.auth import create_access_token, resolve_subscription_end_at
+    from routes.auth import (
+        create_user_access_token,
+        create_user_refresh_token,
+        resolve_subscription_end_at,
+    )
     from models.user import UserResponse
 
-    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User account not found for this order")
-
     if is_signup_order:
         message = (
             "Payment already verified. Welcome back!"
@@ -245,16 +349,16 @@ async def _build_verify_response(
             else "Payment verified and subscription activated!"
         )
 
-    access_token = create_access_token(
-        data={"sub": user_id, "email": user_doc["email"]}
-    )
+    # Re-minted after fulfillment so subscription claims reflect the new plan
+    access_token = create_user_access_token(user_doc)
     return {
         "success": True,
         "message": message,
         "subscription_type": order["plan_id"],
         "access_token": access_token,
+        "refresh_token": create_user_refresh_token(user_doc),
         "user": UserResponse(
-            id=user_id,
+            id=user_doc["id"],
             email=user_doc["email"],
             name=user_doc["name"],
             is_admin=user_doc.get("is_admin", False),
@@ -288,7 +392,7 @@ async def get_payment_config():
     """Get Razorpay configuration for frontend."""
     return {
         "configured": RAZORPAY_CONFIGURED,
-        "key_id": RAZORPAY_KEY_ID if RAZORPAY_CONFIGURED else None,
+        "key_id": payment_gateway.key_id if RAZORPAY_CONFIGURED else None,
         "plans": PLANS,
     }
 
@@ -330,7 +434,7 @@ async def create_order(
             }
         }
 
-        razorpay_order = razorpay_client.order.create(data=order_data)
+        razorpay_order = await payment_gateway.create_order(order_data)
 
         order_doc = {
             "id": str(uuid.uuid4()),
@@ -349,7 +453,7 @@ async def create_order(
             "order_id": razorpay_order["id"],
             "amount": plan["amount"],
             "currency": plan["currency"],
-            "key_id": RAZORPAY_KEY_ID,
+            "key_id": payment_gateway.key_id,
             "plan_name": plan["name"]
         }
     except Exception as e:
@@ -375,6 +479,9 @@ async def create_pending_signup_order(request: CreatePendingSignupOrderRequest):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    from services.password_hashing import password_hasher
+    password_hash = await password_hasher.hash(request.password)
+
     try:
         pending_order_id = str(uuid.uuid4())
 
@@ -391,9 +498,8 @@ async def create_pending_signup_order(request: CreatePendingSignupOrderRequest):
             }
         }
 
-        razorpay_order = razorpay_client.order.create(data=order_data)
+        razorpay_order = await payment_gateway.create_order(order_data)
 
-        from routes.auth import hash_password
         order_doc = {
             "id": pending_order_id,
             "razorpay_order_id": razorpay_order["id"],
@@ -406,7 +512,7 @@ async def create_pending_signup_order(request: CreatePendingSignupOrderRequest):
             "pending_user_data": {
                 "name": request.name,
                 "email": request.email,
-                "password_hash": hash_password(request.password),
+                "password_hash": password_hash,
                 "mobile": request.mobile
             },
             "created_at": datetime.now(timezone.utc).isoformat()
@@ -417,7 +523,7 @@ async def create_pending_signup_order(request: CreatePendingSignupOrderRequest):
             "order_id": razorpay_order["id"],
             "amount": plan["amount"],
             "currency": plan["currency"],
-            "key_id": RAZORPAY_KEY_ID,
+            "key_id": payment_gateway.key_id,
             "plan_name": plan["name"]
         }
     except Exception as e:
@@ -427,7 +533,6 @@ async def create_pending_signup_order(request: CreatePendingSignupOrderRequest):
 @router.post("/verify")
 async def verify_payment(
     request: VerifyPaymentRequest,
-    background_tasks: BackgroundTasks,
     authorization: Optional[str] = Header(None)
 ):
     """Verify Razorpay payment signature and activate subscription. Idempotent."""
@@ -437,14 +542,14 @@ async def verify_payment(
     db = get_db()
 
     try:
-        params_dict = {
-            'razorpay_order_id': request.razorpay_order_id,
-            'razorpay_payment_id': request.razorpay_payment_id,
-            'razorpay_signature': request.razorpay_signature
-        }
-
         print(f"Verifying payment: {request.razorpay_payment_id} for order: {request.razorpay_order_id}")
-        razorpay_client.utility.verify_payment_signature(params_dict)
+        if not verify_payment_signature(
+            request.razorpay_order_id,
+            request.razorpay_payment_id,
+            request.razorpay_signature,
+            payment_gateway.key_secret,
+        ):
+            raise HTTPException(status_code=400, detail="Invalid payment signature")
         print("Signature verified successfully")
 
         order = await db.orders.find_one(
@@ -463,10 +568,9 @@ async def verify_payment(
         )
 
         if order.get("status") == "paid" and order.get("user_id"):
-            return await _build_verify_response(
-                db,
+            return _build_verify_response(
                 order,
-                order["user_id"],
+                await _get_order_user(db, order["user_id"]),
                 is_signup_order=is_signup_order,
                 already_paid=True,
             )
@@ -479,25 +583,22 @@ async def verify_payment(
             if order.get("user_id") and order["user_id"] != user.id:
                 raise HTTPException(status_code=403, detail="Order does not belong to user")
 
-        user_id = await fulfill_paid_order(
+        # Fulfillment hands back the updated user so the response needs no re-read
+        user_doc = await fulfill_paid_order(
             db,
             order,
             request.razorpay_payment_id,
-            background_tasks,
         )
 
-        return await _build_verify_response(
-            db,
+        return _build_verify_response(
             order,
-            user_id,
+            user_doc,
             is_signup_order=is_signup_order,
         )
 
     except Exception as e:
         print(f"Payment verification error: {str(e)}")
-        print(f"Error type: {type(e)._name_}")
-        if razorpay and isinstance(e, razorpay.errors.SignatureVerificationError):
-            raise HTTPException(status_code=400, detail="Invalid payment signature")
+        print(f"Error type: {type(e).__name__}")
         if isinstance(e, HTTPException):
             raise
         raise HTTPException(status_code=500, detail=f"Payment verification failed: {str(e)}")
@@ -522,39 +623,10 @@ async def get_user_orders(
     return orders
 
 
-@router.post("/webhook")
-async def razorpay_webhook(request: Request, background_tasks: BackgroundTasks):
-    """
-    Razorpay webhook endpoint for payment events.
-    Handles payment.captured and payment.failed events.
-    """
-    if not RAZORPAY_WEBHOOK_SECRET:
-        raise HTTPException(status_code=503, detail="Webhook secret not configured")
-
-    body = await request.body()
-    webhook_signature = request.headers.get("X-Razorpay-Signature", "")
-
-    if not webhook_signature:
-        raise HTTPException(status_code=400, detail="Missing webhook signature")
-
-    try:
-        razorpay_client.utility.verify_webhook_signature(
-            body.decode("utf-8"),
-            webhook_signature,
-            RAZORPAY_WEBHOOK_SECRET,
-        )
-    except Exception as e:
-        print(f"Webhook signature verification failed: {e}")
-        raise HTTPException(status_code=401, detail="Invalid webhook signature")
-
-    try:
-        event_data = json.loads(body)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid webhook payload")
-
+async def process_webhook_event(db, event_data: dict) -> None:
+    """Apply one verified Razorpay webhook event. Runs on the webhook queue workers."""
     event = event_data.get("event")
     payload = event_data.get("payload", {})
-    db = get_db()
 
     if event == "payment.captured":
         payment_entity = payload.get("payment", {}).get("entity", {})
@@ -568,12 +640,12 @@ async def razorpay_webhook(request: Request, background_tasks: BackgroundTasks):
 
         if not order:
             print(f"Webhook: Order not found for payment {razorpay_payment_id}")
-            return {"status": "ok"}
+            return
 
         if order.get("status") == "paid":
-            return {"status": "ok"}
+            return
 
-        await fulfill_paid_order(db, order, razorpay_payment_id, background_tasks)
+        await fulfill_paid_order(db, order, razorpay_payment_id)
 
     elif event == "payment.failed":
         payment_entity = payload.get("payment", {}).get("entity", {})
@@ -587,8 +659,10 @@ async def razorpay_webhook(request: Request, background_tasks: BackgroundTasks):
             f"Error: {error_code} - {error_description}"
         )
 
-        await db.orders.update_one(
-            {"razorpay_order_id": razorpay_order_id},
+        # Events arrive out of order across the queue workers: a failed attempt must
+        # never overwrite an order that another payment already paid or is fulfilling
+        result = await db.orders.update_one(
+            {"razorpay_order_id": razorpay_order_id, "status": {"$nin": ["paid", "fulfilling"]}},
             {
                 "$set": {
                     "status": "failed",
@@ -599,5 +673,47 @@ async def razorpay_webhook(request: Request, background_tasks: BackgroundTasks):
                 }
             }
         )
+        if result.matched_count == 0:
+            print(f"Webhook: ignored payment.failed for order {razorpay_order_id} (paid, fulfilling or unknown)")
+
+
+# Verified webhook events are persisted here and drained by background workers
+webhook_queue = MongoJobQueue(
+    "webhook_events",
+    process_webhook_event,
+    concurrency=WEBHOOK_WORKERS,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+)
+
+
+@router.post("/webhook")
+async def razorpay_webhook(request: Request):
+    """
+    Razorpay webhook endpoint for payment events.
+    Verifies and persists the event, then acknowledges immediately; payment.captured
+    and payment.failed are applied by the webhook queue workers.
+    """
+    if not RAZORPAY_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook secret not configured")
+
+    body = await request.body()
+    webhook_signature = request.headers.get("X-Razorpay-Signature", "")
+
+    if not webhook_signature:
+        raise HTTPException(status_code=400, detail="Missing webhook signature")
+
+    if not verify_webhook_signature(body, webhook_signature, RAZORPAY_WEBHOOK_SECRET):
+        print("Webhook signature verification failed")
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        event_data = json.loads(body)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+
+    # Razorpay repeats the same event id on every retry; fall back to the body hash
+    event_id = request.headers.get("X-Razorpay-Event-Id") or hashlib.sha256(body).hexdigest()
+    db = get_db()
+    await webhook_queue.enqueue(db, event_id, event_data, event=event_data.get("event"))
 
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
@@ -1,99 +1,146 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from models.post import PostCreate, PostUpdate, PostInDB, PostResponse, PostPreviewResponse, generate_slug
+from models.post import PostCreate, PostUpdate, PostInDB, PostResponse, PostPreviewResponse, PostSearchResult, generate_slug, RESERVED_SLUGS
 from models.user import UserResponse
-from routes.auth import get_current_user, require_admin, get_db
+from routes.auth import is_subscribed_reader, require_admin, get_db
+from services.post_cache import (
+    post_catalog,
+    encode_listing,
+    encode_cursor,
+    decode_cursor,
+    listing_etag,
+    LISTING_FIELDS,
+)
+from services.post_search import post_search
+from utils.compression import encoded_response, not_modified_response
+from utils.http_cache import is_not_modified, set_validators
 
 router = APIRouter(prefix="/posts", tags=["Posts"])
 
 
+MAX_PAGE_SIZE = 100
+MAX_SEARCH_RESULTS = 50
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse ?fields=title,slug into a projection list that always starts with id."""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in LISTING_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+
+async def find_post(db, key: str) -> Optional[dict]:
+    """
+    Find a post by ID or slug in one round-trip. The catalog's slug map turns a known
+    key into an indexed id lookup; unknown keys go through a single $or query.
+    """
+    post_id = post_catalog.resolve_id(key)
+    if post_id is not None:
+        post = await db.posts.find_one({"id": post_id}, {"_id": 0})
+        if post and key in (post["id"], post["slug"]):
+            return post
+    
+    candidates = await db.posts.find(
+        {"$or": [{"id": key}, {"slug": key}]}, {"_id": 0}
+    ).limit(2).to_list(2)
+    # An ID match wins over a slug match, as before
+    for post in candidates:
+        if post["id"] == key:
+            return post
+    return candidates[0] if candidates else None
+
+
 @router.get("", response_model=List[PostPreviewResponse])
 async def get_all_posts(
-    authorization: Optional[str] = Header(None)
+    authorization: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
 ):
-    """Get all posts. Returns full content for subscribers, preview for others."""
+    """
+    Get posts newest first. Returns full content for subscribers, preview for others.
+    Paginate with ?limit= and the X-Next-Cursor header; trim entries with ?fields=.
+    """
     db = get_db()
-    current_user = await get_current_user(authorization)
-    is_subscribed = current_user and current_user.is_subscribed
-    
-    posts = await db.posts.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    
-    result = []
-    for post in posts:
-        if is_subscribed or not post.get("is_premium", True):
-            # Full access
-            result.append(PostPreviewResponse(
-                id=post["id"],
-                title=post["title"],
-                slug=post["slug"],
-                excerpt=post["excerpt"],
-                preview_content=post["content"],
-                is_premium=post.get("is_premium", True),
-                created_at=post["created_at"],
-                updated_at=post["updated_at"]
-            ))
-        else:
-            # Preview only
-            preview = post["content"][:500] + "..." if len(post["content"]) > 500 else post["content"]
-            result.append(PostPreviewResponse(
-                id=post["id"],
-                title=post["title"],
-                slug=post["slug"],
-                excerpt=post["excerpt"],
-                preview_content=preview,
-                is_premium=post.get("is_premium", True),
-                created_at=post["created_at"],
-                updated_at=post["updated_at"]
-            ))
-    
-    return result
+    projection = _parse_fields(fields)
+    
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    is_subscribed = await is_subscribed_reader(authorization)
+    
+    posts, next_key = await post_catalog.list_posts(db, limit, after)
+    next_cursor = encode_cursor(next_key) if next_key is not None else None
+    etag = listing_etag(posts, is_subscribed, projection, next_cursor)
+    
+    if is_not_modified(etag, if_none_match):
+        response = not_modified_response(etag, accept_encoding)
+    else:
+        # Pages are identified by their ETag, so a cached compressed page skips encoding too
+        response = await encoded_response(
+            etag,
+            accept_encoding,
+            lambda: encode_listing(posts, is_subscribed, projection),
+        )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return set_validators(response, etag)
+
+
+@router.get("/search", response_model=List[PostSearchResult])
+async def search_posts(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Search posts by title, excerpt and content, best matches first. Snippets only
+    quote the preview of premium posts unless the reader is subscribed.
+    """
+    db = get_db()
+    is_subscribed = await is_subscribed_reader(authorization)
+    return await post_search.search(db, q, limit, is_subscribed)
 
 
 @router.get("/{post_id}", response_model=PostResponse)
 async def get_post(
     post_id: str,
-    authorization: Optional[str] = Header(None)
+    authorization: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
 ):
     """Get a single post by ID or slug."""
     db = get_db()
     
-    # Try to find by ID first, then by slug
-    post = await db.posts.find_one({"id": post_id}, {"_id": 0})
-    if not post:
-        post = await db.posts.find_one({"slug": post_id}, {"_id": 0})
-    
+    post = await find_post(db, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    current_user = await get_current_user(authorization)
-    is_subscribed = current_user and current_user.is_subscribed
-    
-    # If premium content and user not subscribed, return preview
-    if post.get("is_premium", True) and not is_subscribed:
-        preview = post["content"][:500] + "..." if len(post["content"]) > 500 else post["content"]
-        return PostResponse(
-            id=post["id"],
-            title=post["title"],
-            slug=post["slug"],
-            excerpt=post["excerpt"],
-            content=preview,
-            is_premium=post.get("is_premium", True),
-            created_at=post["created_at"],
-            updated_at=post["updated_at"]
-        )
+    is_subscribed = await is_subscribed_reader(authorization)
     
-    return PostResponse(
-        id=post["id"],
-        title=post["title"],
-        slug=post["slug"],
-        excerpt=post["excerpt"],
-        content=post["content"],
-        is_premium=post.get("is_premium", True),
-        created_at=post["created_at"],
-        updated_at=post["updated_at"]
-    )
+    # Premium posts fall back to the preview body for non-subscribers
+    variants = post_catalog.variants_for(post)
+    etag = variants.etag(is_subscribed)
+    
+    if is_not_modified(etag, if_none_match, if_modified_since, variants.last_modified):
+        response = not_modified_response(etag, accept_encoding)
+    else:
+        response = await encoded_response(
+            etag, accept_encoding, lambda: variants.detail_json(is_subscribed)
+        )
+    return set_validators(response, etag, variants.last_modified)
 
 
 # Admin endpoints
@@ -111,7 +158,7 @@ async def create_post(
     
     # Ensure unique slug
     counter = 1
-    while await db.posts.find_one({"slug": slug}):
+    while slug in RESERVED_SLUGS or await db.posts.find_one({"slug": slug}):
         slug = f"{base_slug}-{counter}"
         counter += 1
     
@@ -129,6 +176,9 @@ async def create_post(
     post_dict["updated_at"] = post_dict["updated_at"].isoformat()
     
     await db.posts.insert_one(post_dict)
+    post_dict.pop("_id", None)
+    post_catalog.upsert(post_dict)
+    await post_search.index_post(db, post_dict)
     
     return PostResponse(
         id=post.id,
@@ -165,7 +215,7 @@ async def update_post(
         slug = base_slug
         counter = 1
         while True:
-            existing = await db.posts.find_one({"slug": slug, "id": {"$ne": post_id}})
+            existing = slug in RESERVED_SLUGS or await db.posts.find_one({"slug": slug, "id": {"$ne": post_id}})
             if not existing:
                 break
             slug = f"{base_slug}-{counter}"
@@ -185,6 +235,8 @@ async def update_post(
     
     # Fetch updated post
     updated_post = await db.posts.find_one({"id": post_id}, {"_id": 0})
+    post_catalog.upsert(updated_post)
+    await post_search.index_post(db, updated_post)
     
     return PostResponse(
         id=updated_post["id"],
@@ -211,4 +263,7 @@ async def delete_post(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Post not found")
     
+    post_catalog.remove(post_id)
+    await post_search.remove_post(db, post_id)
+    
     return {"message": "Post deleted successfully"}
@@ -4,6 +4,10 @@ Run this as a background task or scheduled job to check for expired subscription
 """
 from fastapi import APIRouter, BackgroundTasks
 from datetime import datetime, timezone
+from typing import List
+import asyncio
+import os
+import uuid
 # Database getter will be set by server.py
 _db = None
 
@@ -15,65 +19,137 @@ def get_db():
     return _db
 
 from services.notifications import send_subscription_expiry_notification
+from services.auth_cache import token_cache
 
 router = APIRouter(prefix="/subscriptions", tags=["Subscriptions"])
 
+# Users expired per bulk write, and notifications sent at once
+EXPIRY_BATCH_SIZE = int(os.environ.get("EXPIRY_BATCH_SIZE", "500"))
+# Kept at the email batch size so a full provider batch can form
+EXPIRY_NOTIFY_CONCURRENCY = int(os.environ.get("EXPIRY_NOTIFY_CONCURRENCY", "100"))
 
-async def check_and_notify_expired_subscriptions():
-    """Check for expired subscriptions and send notifications."""
-    db = get_db()
-    
-    # Find all users with active subscriptions that have expired
-    current_time = datetime.now(timezone.utc)
-    
-    # Find users where subscription_end_at is in the past and is_subscribed is still True
-    expired_users = await db.users.find({
-        "is_subscribed": True,
-        "subscription_type": {"$ne": "lifetime"},
-        "subscription_end_at": {"$exists": True, "$ne": None, "$lt": current_time.isoformat()}
-    }).to_list(length=None)
-    
-    notification_results = []
-    
-    for user in expired_users:
+
+# Per-user failures reported by one run; the rest are only counted
+EXPIRY_MAX_REPORTED_FAILURES = int(os.environ.get("EXPIRY_MAX_REPORTED_FAILURES", "100"))
+
+
+class ExpiryReport:
+    """Running totals for one expiry run, so memory stays flat however many users expire."""
+
+    def __init__(self):
+        # Stamped on the users this run unsubscribes, so it can tell them apart
+        self.run_id = uuid.uuid4().hex
+        self.expired_count = 0
+        self.emails_sent = 0
+        self.sms_sent = 0
+        self.failed_count = 0
+        self.failures: List[dict] = []
+
+    def add_failure(self, user_id: str, error: str) -> None:
+        self.failed_count += 1
+        if len(self.failures) < EXPIRY_MAX_REPORTED_FAILURES:
+            self.failures.append({"user_id": user_id, "error": error})
+
+
+async def _notify_expired_user(user: dict, semaphore: asyncio.Semaphore, report: ExpiryReport) -> None:
+    """Send the expiry email/SMS for one user, limited by the shared semaphore."""
+    async with semaphore:
         try:
-            # Update user subscription status
-            await db.users.update_one(
-                {"id": user["id"]},
-                {
-                    "$set": {
-                        "is_subscribed": False,
-                        "updated_at": current_time.isoformat()
-                    }
-                }
-            )
-            
-            # Send notification
             result = await send_subscription_expiry_notification(
                 user.get("name", "User"),
                 user.get("email", ""),
                 user.get("mobile"),
                 user.get("subscription_type", "monthly")
             )
-            
-            notification_results.append({
-                "user_id": user["id"],
-                "email": user.get("email"),
-                "email_sent": result.get("email_sent", False),
-                "sms_sent": result.get("sms_sent", False)
-            })
-            
+            report.emails_sent += bool(result.get("email_sent"))
+            report.sms_sent += bool(result.get("sms_sent"))
         except Exception as e:
             print(f"Error processing expired subscription for user {user.get('id')}: {e}")
-            notification_results.append({
-                "user_id": user.get("id"),
-                "error": str(e)
-            })
+            report.add_failure(user.get("id"), str(e))
+
+
+async def _expire_batch(
+    db,
+    users: List[dict],
+    current_time: datetime,
+    semaphore: asyncio.Semaphore,
+    report: ExpiryReport,
+) -> None:
+    """Flip one chunk of users to unsubscribed in a single write, then notify them concurrently."""
+    user_ids = [user["id"] for user in users]
+    now = current_time.isoformat()
+    try:
+        # Re-check the end date: a user who renewed since the cursor read must stay subscribed
+        await db.users.update_many(
+            {"id": {"$in": user_ids}, "is_subscribed": True, "subscription_end_at": {"$lt": now}},
+            {
+                "$set": {
+                    "is_subscribed": False,
+                    "updated_at": now,
+                    "expired_by_run": report.run_id
+                }
+            }
+        )
+        # Only the users this run actually expired are notified
+        expired = await db.users.find(
+            {"id": {"$in": user_ids}, "expired_by_run": report.run_id},
+            {"_id": 0, "id": 1},
+        ).to_list(length=None)
+    except Exception as e:
+        print(f"Error expiring subscriptions for {len(user_ids)} users: {e}")
+        for user_id in user_ids:
+            report.add_failure(user_id, str(e))
+        return
+    
+    expired_ids = {user["id"] for user in expired}
+    for user_id in expired_ids:
+        token_cache.invalidate_user(user_id)
+    report.expired_count += len(expired_ids)
+    
+    await asyncio.gather(*(
+        _notify_expired_user(user, semaphore, report) for user in users if user["id"] in expired_ids
+    ))
+
+
+async def check_and_notify_expired_subscriptions():
+    """Check for expired subscriptions and send notifications."""
+    db = get_db()
+    
+    # Find all users with active subscriptions that have expired
+    current_time = datetime.now(timezone.utc)
+    
+    # Stream users where subscription_end_at is in the past and is_subscribed is still True
+    cursor = db.users.find(
+        {
+            "is_subscribed": True,
+            "subscription_type": {"$ne": "lifetime"},
+            "subscription_end_at": {"$exists": True, "$ne": None, "$lt": current_time.isoformat()}
+        },
+        {"_id": 0, "id": 1, "name": 1, "email": 1, "mobile": 1, "subscription_type": 1}
+    ).batch_size(EXPIRY_BATCH_SIZE)
+    
+    semaphore = asyncio.Semaphore(EXPIRY_NOTIFY_CONCURRENCY)
+    report = ExpiryReport()
+    batch = []
+    
+    async for user in cursor:
+        batch.append(user)
+        if len(batch) >= EXPIRY_BATCH_SIZE:
+            await _expire_batch(db, batch, current_time, semaphore, report)
+            batch = []
+    
+    if batch:
+        await _expire_batch(db, batch, current_time, semaphore, report)
     
     return {
         "checked_at": current_time.isoformat(),
-        "expired_count": len(expired_users),
-        "notifications": notification_results
+        "run_id": report.run_id,
+        "expired_count": report.expired_count,
+        "emails_sent": report.emails_sent,
+        "sms_sent": report.sms_sent,
+        "failed_count": report.failed_count,
+        # Capped at EXPIRY_MAX_REPORTED_FAILURES entries
+        "failures": report.failures,
     }
 
 
@@ -14,15 +14,23 @@ uri = os.getenv("MONGODB_URI")
 client = AsyncIOMotorClient(uri)
 db = client[os.getenv("DB_NAME", "faith_by_experiments")]
 
-# Create the main app
-app = FastAPI(title="Faith by Experiments API")
+# Create the main app; route return values are serialized with orjson when available
+from utils.json_encoding import APIJSONResponse
 
-# Serve uploads directory as static files
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-UPLOAD_DIR = Path(__file__).parent / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+app = FastAPI(title="Faith by Experiments API", default_response_class=APIJSONResponse)
+
+# Serve uploads: straight from disk with the local driver, otherwise redirect to object storage
+from fastapi.responses import RedirectResponse
+from services.storage import PRESIGNED_REDIRECT_CACHE_CONTROL, storage
+from utils.http_cache import IMMUTABLE_CACHE_CONTROL
+from utils.static_files import CONTENT_HASHED_NAME, ContentHashedStaticFiles
+
+if storage.name == "local":
+    app.mount("/uploads", ContentHashedStaticFiles(directory=storage.root), name="uploads")
+else:
+    @app.get("/uploads/{key:path}", include_in_schema=False)
+    async def redirect_upload(key: str):
+        return storage.redirect(key)
 
 # CORS middleware - MUST be added before routers
 origins = [
@@ -37,8 +45,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Compress JSON/text bodies; added last so it wraps CORS and sees the final headers
+from utils.compression import CompressionMiddleware, compressed_bodies
+
+app.add_middleware(CompressionMiddleware)
+
 # Import routes and set database
 from routes import auth, posts, password_reset, payments, contact, subscription_expiry
 
@@ -66,18 +80,83 @@ async def root():
     return {"message": "Faith by Experiments API", "status": "running"}
 
 # Image upload endpoint
-from fastapi import HTTPException
-from upload_utils import save_upload_file
+from fastapi import HTTPException, Depends, Request
+from fastapi.responses import FileResponse, Response
+from utils.http_cache import etag_matches
+from typing import Optional
+from models.user import UserResponse
+from routes.auth import require_admin
+from upload_utils import stage_upload_file, store_staged_upload
+from services.post_cache import post_catalog
+from services.auth_cache import token_cache
+from services.password_hashing import password_hasher
+from services.notifications import email_dispatcher, sms_transport
+from services.email_templates import email_templates
+from services.notification_outbox import notification_outbox
+from services.image_pipeline import MIME_TYPES, image_pipeline
+from services.post_search import post_search
 
 @api_router.post("/upload-image")
 async def upload_image(image: UploadFile = File(...)):
     try:
-        filename = await save_upload_file(image)
-        file_url = f"/uploads/{filename}"
-        return {"success": True, "url": file_url}
+        staged = await stage_upload_file(image)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
 
+    try:
+        # Derivatives are rendered from the staged local copy before it is handed off
+        manifest = await image_pipeline.process(staged.filename, staged.path)
+    except Exception as e:
+        # The original is still stored; serve it unprocessed rather than failing the upload
+        print(f"Image derivative generation failed for {staged.filename}: {e}")
+        manifest = None
+
+    try:
+        filename = await store_staged_upload(staged)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
+
+    file_url = f"/uploads/{filename}"
+    if manifest is None:
+        return {"success": True, "url": file_url}
+
+    return {
+        "success": True,
+        # Negotiated endpoint: picks AVIF/WebP/JPEG by Accept and width by ?w=
+        "url": f"/api/images/{manifest['stem']}",
+        "original_url": file_url,
+        "width": manifest["width"],
+        "height": manifest["height"],
+        "srcset": manifest["srcset"],
+    }
+
+
+@api_router.get("/images/{stem}")
+async def get_image(stem: str, request: Request, w: Optional[int] = None):
+    """Serve the best derivative of an uploaded image for the client's Accept header."""
+    manifest = await image_pipeline.manifest(stem)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    variant = image_pipeline.select(manifest, request.headers.get("accept", ""), w)
+    name = os.path.basename(variant["url"])
+    key = variant.get("key") or f"derived/{name}"
+    etag = f'"{name}"'
+    headers = {"ETag": etag, "Vary": "Accept"}
+    if CONTENT_HASHED_NAME.match(name):
+        # Fixed bytes per (id, Accept, w); Vary keeps the formats apart in caches
+        headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    local_path = storage.local_path(key)
+    if local_path is None:
+        if not storage.stable_urls:
+            headers["Cache-Control"] = PRESIGNED_REDIRECT_CACHE_CONTROL
+        return RedirectResponse(storage.public_url(key), status_code=302, headers=headers)
+    return FileResponse(local_path, media_type=MIME_TYPES[variant["format"]], headers=headers)
+
 
 
 @api_router.get("/health")
@@ -85,11 +164,24 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@api_router.get("/metrics")
+async def get_metrics(admin: UserResponse = Depends(require_admin)):
+    """Runtime counters for the in-process worker pools and caches (admin only)."""
+    return {
+        "password_hashing": password_hasher.stats(),
+        "auth_cache": token_cache.stats(),
+        "webhook_queue": await payments.webhook_queue.stats(db),
+        "notification_outbox": await notification_outbox.stats(db),
+        "sms": sms_transport.stats(),
+        "email": email_dispatcher.stats(),
+        "compressed_bodies": compressed_bodies.stats(),
+    }
+
+
 @api_router.post("/create-test-user")
 async def create_test_user():
     """Create a test user for testing purposes."""
     from datetime import datetime, timezone
-    from utils.auth import hash_password
     import uuid
     
     email = "test@gmail.com"
@@ -113,7 +205,7 @@ async def create_test_user():
         "id": user_id,
         "email": email,
         "name": "Test User",
-        "password_hash": hash_password("test123"),
+        "password_hash": await password_hasher.hash("test123"),
         "is_admin": False,
         "is_subscribed": True,
         "subscription_type": "monthly",
@@ -140,7 +232,6 @@ async def create_test_user():
 async def seed_database():
     """Seed the database with initial data."""
     from datetime import datetime, timezone
-    from utils.auth import hash_password
     import uuid
     
     # Check if admin user exists
@@ -152,7 +243,7 @@ async def seed_database():
             "id": str(uuid.uuid4()),
             "email": "admin@faithbyexperiments.com",
             "name": "Admin",
-            "password_hash": hash_password("admin123"),
+            "password_hash": await password_hasher.hash("admin123"),
             "is_admin": True,
             "is_subscribed": True,
             "subscription_type": "yearly",
@@ -167,7 +258,7 @@ async def seed_database():
             {"email": "admin@faithbyexperiments.com"},
             {
                 "$set": {
-                    "password_hash": hash_password("admin123"),
+                    "password_hash": await password_hasher.hash("admin123"),
                     "is_admin": True,
                     "is_subscribed": True,
                     "subscription_type": "yearly",
@@ -175,6 +266,7 @@ async def seed_database():
                 }
             }
         )
+        token_cache.clear()
         logger.info("Admin user updated/reset")
     
     # Check if posts exist
@@ -201,6 +293,9 @@ The methodology is simple but demanding: treat every spiritual proposition as a
             "updated_at": datetime.now(timezone.utc).isoformat()
         }
         await db.posts.insert_one(initial_post)
+        initial_post.pop("_id", None)
+        post_catalog.invalidate()
+        await post_search.index_post(db, initial_post)
     
     return {"message": "Database seeded successfully"}
 
@@ -222,13 +317,30 @@ async def startup_event():
     # Create indexes
     await db.users.create_index("email", unique=True)
     await db.users.create_index("id", unique=True)
+    await auth.ensure_indexes(db)
     await db.posts.create_index("id", unique=True)
     await db.posts.create_index("slug", unique=True)
+    await db.posts.create_index([("created_at", -1), ("id", -1)])
+    await post_search.ensure_indexes(db)
     await db.orders.create_index("razorpay_order_id", unique=True, sparse=True)
     await db.orders.create_index("id", unique=True)
+    await payments.webhook_queue.ensure_indexes(db)
+    await notification_outbox.ensure_indexes(db)
     logger.info("Database indexes created")
+    
+    payments.webhook_queue.start(db)
+    notification_outbox.start(db)
+    logger.info(f"Email templates compiled: {', '.join(email_templates.load_all())}")
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await payments.webhook_queue.stop()
+    await notification_outbox.stop()
     client.close()
+    password_hasher.shutdown()
+    if payments.payment_gateway:
+        payments.payment_gateway.shutdown()
+    await sms_transport.aclose()
+    await email_dispatcher.aclose()
+    image_pipeline.shutdown()
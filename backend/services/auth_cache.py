@@ -0,0 +1,86 @@
+"""
+Verified-token cache for get_current_user
+Remembers the user resolved from a bearer token so authenticated requests skip the
+JWT verification and the users lookup. Entries are invalidated per user whenever
+subscription or password state changes.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from models.user import UserResponse
+
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TokenCache:
+    """Bounded LRU of token -> UserResponse with a TTL that never outlives the token."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = AUTH_CACHE_TTL_SECONDS,
+        max_entries: int = AUTH_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, UserResponse]]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[UserResponse]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if time.time() >= expires_at:
+            self._discard(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: UserResponse, token_exp: Optional[float] = None) -> None:
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        self._discard(token)
+        self._entries[token] = (expires_at, user)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+
+    def invalidate_user(self, user_id: Optional[str]) -> None:
+        """Forget every cached token for a user after their account changes."""
+        if not user_id:
+            return
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _discard(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+token_cache = TokenCache()
@@ -0,0 +1,219 @@
+"""
+Batching email dispatcher
+Collects outgoing messages and sends them through the provider's batch API, flushing
+when a batch fills up or the oldest message has waited EMAIL_BATCH_MAX_DELAY_SECONDS.
+Select the provider with EMAIL_PROVIDER=resend|fake|console.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+import resend
+from resend.exceptions import ResendError
+
+from utils.stats import latency_summary
+
+EMAIL_PROVIDER = os.environ.get("EMAIL_PROVIDER", "").strip().lower()
+# Resend accepts at most 100 messages per batch request
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", "100"))
+EMAIL_BATCH_MAX_DELAY_SECONDS = float(os.environ.get("EMAIL_BATCH_MAX_DELAY_SECONDS", "0.5"))
+# Simulated round-trip for the fake provider
+FAKE_EMAIL_LATENCY_SECONDS = float(os.environ.get("FAKE_EMAIL_LATENCY_SECONDS", "0.2"))
+
+
+class EmailRejected(Exception):
+    """The provider refused a batch because of its content, e.g. an invalid address."""
+
+
+class ResendEmailProvider:
+    """Sends a batch with one Resend /emails/batch request."""
+
+    name = "resend"
+    max_batch_size = 100
+
+    async def send_batch(self, messages: List[dict]) -> List[str]:
+        try:
+            # The SDK is synchronous; one thread hop per batch rather than per message
+            response = await asyncio.to_thread(resend.Batch.send, messages)
+        except ResendError as e:
+            # Batches are validated as a whole: one bad message fails all of them
+            if str(e.code) in ("400", "422"):
+                raise EmailRejected(e.message) from e
+            raise
+        return [item.get("id", "") for item in response.get("data", [])]
+
+
+class FakeEmailProvider:
+    """Offline stand-in with provider-like latency, for throughput measurements."""
+
+    name = "fake"
+    max_batch_size = 100
+
+    def __init__(self, latency_seconds: float = FAKE_EMAIL_LATENCY_SECONDS):
+        self.latency_seconds = latency_seconds
+        self.sent = []
+
+    async def send_batch(self, messages: List[dict]) -> List[str]:
+        await asyncio.sleep(self.latency_seconds)
+        if any("@" not in to for message in messages for to in message["to"]):
+            raise EmailRejected("Invalid `to` field")
+        self.sent.extend(messages)
+        return [uuid.uuid4().hex for _ in messages]
+
+
+class ConsoleEmailProvider:
+    """Prints messages instead of sending them (development default)."""
+
+    name = "console"
+    max_batch_size = 100
+
+    async def send_batch(self, messages: List[dict]) -> List[str]:
+        for message in messages:
+            print(f"[DEV MODE] Email would be sent to {', '.join(message['to'])}")
+            print(f"Subject: {message['subject']}")
+            print(f"Content: {message['html'][:200]}...")
+        return ["dev"] * len(messages)
+
+
+class EmailDispatcher:
+    """Accumulates messages and flushes them in provider batches on size or time."""
+
+    def __init__(
+        self,
+        provider,
+        sender: str,
+        batch_size: int = EMAIL_BATCH_SIZE,
+        max_delay_seconds: float = EMAIL_BATCH_MAX_DELAY_SECONDS,
+    ):
+        self.provider = provider
+        self.sender = sender
+        self.batch_size = max(1, min(batch_size, provider.max_batch_size))
+        self.max_delay_seconds = max_delay_seconds
+
+        self._pending = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.failed_batches = 0
+        self.split_batches = 0
+        self.sent = 0
+        self.failed = 0
+        self._batch_latencies = deque(maxlen=1000)
+        self._batch_sizes = deque(maxlen=1000)
+
+    async def send(self, to: str, subject: str, html: str) -> bool:
+        """Queue one message and wait until its batch has been sent. Returns success."""
+        self._ensure_flusher()
+        future = asyncio.get_running_loop().create_future()
+        message = {"from": self.sender, "to": [to], "subject": subject, "html": html}
+        self._pending.append((time.monotonic(), message, future))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        elif len(self._pending) == 1:
+            # Start the delay clock for a fresh batch
+            self._wakeup.set()
+        return await future
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            deadline = self._pending[0][0] + self.max_delay_seconds
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush_one()
+
+    async def _flush_one(self) -> None:
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        if not batch:
+            return
+        messages = [message for _, message, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = await self._deliver(messages)
+        finally:
+            self.batches += 1
+            self._batch_latencies.append(time.perf_counter() - started)
+            self._batch_sizes.append(len(batch))
+
+        self.sent += results.count(True)
+        self.failed += results.count(False)
+        for (_, _, future), ok in zip(batch, results):
+            if not future.done():
+                future.set_result(ok)
+
+    async def _deliver(self, messages: List[dict]) -> List[bool]:
+        """
+        Send messages in one provider call and report success per message. A batch
+        rejected for its content is split in halves until the bad messages are
+        isolated, so one invalid address does not fail everything batched with it.
+        """
+        try:
+            await self.provider.send_batch(messages)
+        except EmailRejected as e:
+            if len(messages) > 1:
+                self.split_batches += 1
+                middle = len(messages) // 2
+                return await self._deliver(messages[:middle]) + await self._deliver(messages[middle:])
+            print(f"Email to {', '.join(messages[0]['to'])} rejected: {e}")
+            return [False]
+        except Exception as e:
+            self.failed_batches += 1
+            print(f"Email batch of {len(messages)} failed: {e}")
+            return [False] * len(messages)
+        return [True] * len(messages)
+
+    async def aclose(self) -> None:
+        """Send whatever is still queued, then stop the flusher."""
+        while self._pending:
+            await self._flush_one()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+
+    def stats(self) -> dict:
+        sizes = self._batch_sizes
+        return {
+            "provider": self.provider.name,
+            "batch_size": self.batch_size,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "split_batches": self.split_batches,
+            "sent": self.sent,
+            "failed": self.failed,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "batch_latency": latency_summary(self._batch_latencies),
+        }
+
+
+def build_email_provider(api_key: str):
+    """Return the configured provider; falls back to the console without a Resend key."""
+    if EMAIL_PROVIDER == "fake":
+        return FakeEmailProvider()
+    if EMAIL_PROVIDER == "console":
+        return ConsoleEmailProvider()
+    if api_key:
+        return ResendEmailProvider()
+    return ConsoleEmailProvider()
@@ -0,0 +1,252 @@
+"""
+Image derivative pipeline
+Re-encodes uploaded images into width-bucketed AVIF/WebP variants plus a JPEG/PNG
+fallback on a process pool, and writes a srcset-ready manifest next to them.
+Needs Pillow; without it uploads are stored and served unchanged.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Optional dependency
+    Image = None
+
+from services.storage import UPLOAD_STAGING_DIR, storage
+
+IMAGE_WIDTHS = sorted(
+    int(width)
+    for width in os.environ.get("IMAGE_DERIVATIVE_WIDTHS", "320,640,960,1280,1920").split(",")
+    if width.strip()
+)
+IMAGE_PROCESS_WORKERS = int(
+    os.environ.get("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+# AVIF encodes are slow; set IMAGE_AVIF=false to skip them
+IMAGE_AVIF = os.environ.get("IMAGE_AVIF", "true").strip().lower() in ("1", "true", "yes")
+# Width served by /api/images/{stem} when the client does not ask for one
+IMAGE_DEFAULT_WIDTH = int(os.environ.get("IMAGE_DEFAULT_WIDTH", "1280"))
+# Manifests kept in memory; older ones are read back from storage on demand
+IMAGE_MANIFEST_CACHE_ENTRIES = int(os.environ.get("IMAGE_MANIFEST_CACHE_ENTRIES", "1024"))
+IMAGE_MAX_PIXELS = 50_000_000
+
+# sha256 content hashes (older uploads used 32-character uuid hex)
+STEM_PATTERN = re.compile(r"^[0-9a-f]{32}([0-9a-f]{32})?$")
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg", "png": "png"}
+SAVE_OPTIONS = {
+    "avif": {"quality": 55, "speed": 6},
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+}
+
+
+def _render_width(source_path: str, output_dir: str, stem: str, width: int, formats: List[str]) -> List[dict]:
+    """Resize the source to one width bucket and encode it in each format (runs in a worker process)."""
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    variants = []
+    with Image.open(source_path) as image:
+        # Let the JPEG decoder downscale while decoding when the target is much smaller
+        image.draft("RGB", (width, max(1, image.height * width // image.width)))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for fmt in formats:
+            if fmt == "jpeg" and has_alpha:
+                fmt = "png"
+            path = os.path.join(output_dir, f"{stem}-{image.width}.{EXTENSIONS[fmt]}")
+            image.save(path, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+            variants.append({
+                "format": fmt,
+                "width": image.width,
+                "height": image.height,
+                "file": os.path.basename(path),
+                "bytes": os.path.getsize(path),
+            })
+    return variants
+
+
+def _probe(source_path: str) -> Optional[dict]:
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    with Image.open(source_path) as image:
+        if getattr(image, "is_animated", False):
+            return None
+        image = ImageOps.exif_transpose(image)
+        return {"width": image.width, "height": image.height}
+
+
+class ImagePipeline:
+    """Generates derivatives on a process pool and publishes them through the storage driver."""
+
+    def __init__(
+        self,
+        storage,
+        work_dir: str,
+        widths: List[int] = IMAGE_WIDTHS,
+        workers: int = IMAGE_PROCESS_WORKERS,
+        manifest_cache_entries: int = IMAGE_MANIFEST_CACHE_ENTRIES,
+    ):
+        self.storage = storage
+        self.work_dir = work_dir
+        self.widths = widths
+        self.workers = max(1, workers)
+        self.manifest_cache_entries = manifest_cache_entries
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manifests: "OrderedDict[str, dict]" = OrderedDict()
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def formats(self) -> List[str]:
+        formats = ["webp", "jpeg"]
+        if IMAGE_AVIF and features.check("avif"):
+            formats.insert(0, "avif")
+        return formats
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # The API process runs Motor and thread-pool threads; forking it can copy a held
+            # lock into the child, so workers start from a clean forkserver process instead
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        """Run fn in a worker process, replacing the pool once if it is broken."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM kill, or Pillow crashing on a hostile file) and the pool
+            # refuses all further work; start a fresh one and retry once
+            print("Image worker pool broke; restarting it")
+            self._discard_executor(executor)
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def _remember(self, stem: str, manifest: dict) -> None:
+        self._manifests[stem] = manifest
+        self._manifests.move_to_end(stem)
+        while len(self._manifests) > self.manifest_cache_entries:
+            self._manifests.popitem(last=False)
+
+    async def process(self, filename: str, source_path: str) -> Optional[dict]:
+        """
+        Build derivatives for an upload from its local copy. Returns the manifest,
+        or None if the image is skipped.
+        """
+        if not self.available:
+            return None
+        stem = os.path.splitext(filename)[0]
+        existing = await self.manifest(stem)
+        if existing is not None:
+            # Content-hashed names: a repeat upload already has its derivatives
+            return existing
+
+        size = await self._run(_probe, source_path)
+        if size is None:
+            # Animated images are served as uploaded
+            return None
+
+        # Buckets below the original width, plus the original size capped at the largest bucket
+        widths = [width for width in self.widths if width < size["width"]]
+        widths.append(min(size["width"], self.widths[-1]))
+        formats = self.formats()
+        output_dir = tempfile.mkdtemp(prefix=f"{stem[:16]}-", dir=self.work_dir)
+        try:
+            results = await asyncio.gather(*[
+                self._run(_render_width, source_path, output_dir, stem, width, formats)
+                for width in sorted(set(widths))
+            ])
+            variants: Dict[str, List[dict]] = {}
+            for variant in (v for batch in results for v in batch):
+                key = f"derived/{variant.pop('file')}"
+                await self.storage.put_file(
+                    os.path.join(output_dir, os.path.basename(key)),
+                    key,
+                    MIME_TYPES[variant["format"]],
+                    move=True,
+                )
+                variant["key"] = key
+                variant["url"] = f"/uploads/{key}"
+                variants.setdefault(variant["format"], []).append(variant)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        manifest = {
+            "stem": stem,
+            "original": f"/uploads/{filename}",
+            "width": size["width"],
+            "height": size["height"],
+            "variants": variants,
+            "srcset": {
+                MIME_TYPES[fmt]: ", ".join(f"{v['url']} {v['width']}w" for v in entries)
+                for fmt, entries in variants.items()
+            },
+        }
+        # Written last: its presence means every variant is in place
+        await self.storage.put_bytes(
+            json.dumps(manifest).encode(), f"derived/{stem}.json", "application/json"
+        )
+        self._remember(stem, manifest)
+        return manifest
+
+    async def manifest(self, stem: str) -> Optional[dict]:
+        if not STEM_PATTERN.match(stem):
+            return None
+        manifest = self._manifests.get(stem)
+        if manifest is None:
+            data = await self.storage.read_bytes(f"derived/{stem}.json")
+            if data is None:
+                return None
+            manifest = json.loads(data)
+        self._remember(stem, manifest)
+        return manifest
+
+    def select(self, manifest: dict, accept: str, width: Optional[int] = None) -> dict:
+        """Pick the best variant for an Accept header: AVIF, then WebP, then the fallback."""
+        accept = (accept or "").lower()
+        variants = manifest["variants"]
+        for fmt in ("avif", "webp"):
+            if fmt in variants and MIME_TYPES[fmt] in accept:
+                entries = variants[fmt]
+                break
+        else:
+            entries = variants.get("jpeg") or variants.get("png")
+
+        target = width or IMAGE_DEFAULT_WIDTH
+        for entry in entries:
+            if entry["width"] >= target:
+                return entry
+        return entries[-1]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._discard_executor(self._executor)
+
+
+image_pipeline = ImagePipeline(storage, UPLOAD_STAGING_DIR)
@@ -0,0 +1,228 @@
+"""
+Mongo-backed job queue
+Jobs are persisted to a collection, keyed by a caller-supplied id so replays are
+dropped, then claimed atomically by in-process workers and retried with
+exponential backoff. Every API replica can run workers against the same collection.
+Finished jobs are kept for JOB_RETENTION_DAYS, which is also how long an id is
+remembered for dropping replays, then removed by a TTL index.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from utils.stats import latency_summary
+
+# Razorpay retries a webhook for up to 24 hours, so a week covers every replay
+JOB_RETENTION_DAYS = float(os.environ.get("JOB_RETENTION_DAYS", "7"))
+
+JobHandler = Callable[[object, dict], Awaitable[None]]
+
+
+class MongoJobQueue:
+    """Durable queue with idempotent enqueue, bounded concurrency and retry with backoff."""
+
+    def __init__(
+        self,
+        collection_name: str,
+        handler: JobHandler,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        backoff_seconds: float = 5.0,
+        lease_seconds: float = 300.0,
+        poll_interval_seconds: float = 5.0,
+        retention_seconds: float = JOB_RETENTION_DAYS * 86400,
+    ):
+        self.collection_name = collection_name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.retention_seconds = retention_seconds
+
+        self._db = None
+        self._workers = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.enqueued = 0
+        self.duplicates = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.leases_lost = 0
+        self._queue_waits = deque(maxlen=1000)
+        self._durations = deque(maxlen=1000)
+        self._completed_at = deque(maxlen=10000)
+
+    def _collection(self, db):
+        return db[self.collection_name]
+
+    async def ensure_indexes(self, db) -> None:
+        collection = self._collection(db)
+        await collection.create_index("id", unique=True)
+        await collection.create_index([("status", 1), ("available_at", 1)])
+        # finished_at is only set on done/failed jobs and is a BSON date, as TTL requires
+        ttl = int(self.retention_seconds)
+        try:
+            await collection.create_index("finished_at", expireAfterSeconds=ttl)
+        except OperationFailure:
+            # Built with another retention; change it in place
+            await db.command(
+                "collMod",
+                self.collection_name,
+                index={"keyPattern": {"finished_at": 1}, "expireAfterSeconds": ttl},
+            )
+
+    async def enqueue(self, db, job_id: str, payload: dict, **fields) -> bool:
+        """Persist a job. Returns False if a job with this id was already queued."""
+        now = datetime.now(timezone.utc).isoformat()
+        doc = {
+            "id": job_id,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+            **fields,
+        }
+        try:
+            await self._collection(db).insert_one(doc)
+        except DuplicateKeyError:
+            self.duplicates += 1
+            return False
+
+        self.enqueued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def _claim(self, db) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self._collection(db).find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "available_at": {"$lte": now.isoformat()}},
+                    # Reclaim jobs whose worker died mid-flight
+                    {"status": "processing", "locked_until": {"$lt": now.isoformat()}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": "processing",
+                    "started_at": now.isoformat(),
+                    "locked_until": (now + timedelta(seconds=self.lease_seconds)).isoformat(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run_job(self, db, job: dict) -> None:
+        started = datetime.now(timezone.utc)
+        created_at = datetime.fromisoformat(job["created_at"])
+        self._queue_waits.append(max(0.0, (started - created_at).total_seconds()))
+
+        try:
+            await self.handler(db, job["payload"])
+        except Exception as e:
+            finished = datetime.now(timezone.utc)
+            self._durations.append((finished - started).total_seconds())
+            attempts = job.get("attempts", 1)
+            if attempts >= self.max_attempts:
+                update = {"status": "failed", "finished_at": finished}
+            else:
+                delay = self.backoff_seconds * (2 ** (attempts - 1))
+                update = {
+                    "status": "pending",
+                    "available_at": (finished + timedelta(seconds=delay)).isoformat(),
+                }
+            update["last_error"] = str(e)
+            if not await self._finish(db, job, update):
+                return
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                print(f"{self.collection_name}: job {job['id']} failed permanently: {e}")
+            else:
+                self.retried += 1
+                print(f"{self.collection_name}: job {job['id']} failed, retrying in {delay:.0f}s: {e}")
+            return
+
+        finished = datetime.now(timezone.utc)
+        self._durations.append((finished - started).total_seconds())
+        if await self._finish(db, job, {"status": "done", "finished_at": finished}):
+            self.succeeded += 1
+            self._completed_at.append(time.monotonic())
+
+    async def _finish(self, db, job: dict, update: dict) -> bool:
+        """
+        Record a job's outcome, but only while this worker still holds its claim.
+        Returns False if the lease ran out and another worker re-claimed the job.
+        """
+        result = await self._collection(db).update_one(
+            {"id": job["id"], "status": "processing", "locked_until": job["locked_until"]},
+            {"$set": update},
+        )
+        if result.matched_count == 0:
+            self.leases_lost += 1
+            print(f"{self.collection_name}: job {job['id']} outlived its lease; leaving it to the new owner")
+            return False
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self._claim(self._db)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run_job(self._db, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{self.collection_name}: worker error: {e}")
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    def start(self, db) -> None:
+        """Start the worker tasks on the running event loop."""
+        if self._workers:
+            return
+        self._db = db
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def stats(self, db) -> dict:
+        collection = self._collection(db)
+        return {
+            "workers": len(self._workers),
+            "pending": await collection.count_documents({"status": "pending"}),
+            "processing": await collection.count_documents({"status": "processing"}),
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "leases_lost": self.leases_lost,
+            "completed_last_minute": sum(
+                1 for completed in self._completed_at if completed >= time.monotonic() - 60
+            ),
+            "queue_wait": latency_summary(self._queue_waits),
+            "processing_time": latency_summary(self._durations),
+        }
@@ -0,0 +1,75 @@
+"""
+Notification outbox
+Notifications are written to a MongoDB outbox as part of the step that triggers
+them (e.g. order fulfillment) and delivered by background workers with retries,
+so a restart or a slow provider never loses or delays a request. One outbox entry
+is one message on one channel, so a retry never re-sends what already went out.
+"""
+import os
+from typing import Optional
+
+from services.job_queue import MongoJobQueue
+from services.notifications import (
+    send_email,
+    send_sms,
+    subscription_purchase_email,
+    subscription_purchase_sms,
+)
+
+NOTIFICATION_WORKERS = int(os.environ.get("NOTIFICATION_WORKERS", "10"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "6"))
+NOTIFICATION_RETRY_BACKOFF_SECONDS = float(os.environ.get("NOTIFICATION_RETRY_BACKOFF_SECONDS", "10"))
+
+
+class NotificationDeliveryError(Exception):
+    """The provider did not accept the message; the outbox will retry it."""
+
+
+def _build_message(kind: str, channel: str, params: dict):
+    if kind == "subscription_purchase":
+        if channel == "email":
+            return subscription_purchase_email(**params)
+        return subscription_purchase_sms(**params)
+    raise ValueError(f"Unknown notification kind: {kind}")
+
+
+async def deliver_notification(db, payload: dict) -> None:
+    """Outbox handler: render and send one message, raising so failures are retried."""
+    channel = payload["channel"]
+    message = _build_message(payload["kind"], channel, payload["params"])
+    if channel == "email":
+        subject, html_content = message
+        sent = await send_email(payload["to"], subject, html_content)
+    else:
+        sent = await send_sms(payload["to"], message)
+    if not sent:
+        raise NotificationDeliveryError(f"{channel} to {payload['to']} was not accepted")
+
+
+notification_outbox = MongoJobQueue(
+    "notification_outbox",
+    deliver_notification,
+    concurrency=NOTIFICATION_WORKERS,
+    max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+    backoff_seconds=NOTIFICATION_RETRY_BACKOFF_SECONDS,
+)
+
+
+async def enqueue_notification(
+    db,
+    dedupe_key: str,
+    kind: str,
+    params: dict,
+    email: Optional[str] = None,
+    mobile: Optional[str] = None,
+) -> None:
+    """Write one outbox entry per channel. Re-enqueueing the same dedupe_key is a no-op."""
+    for channel, to in (("email", email), ("sms", mobile)):
+        if not to:
+            continue
+        await notification_outbox.enqueue(
+            db,
+            f"{dedupe_key}:{channel}",
+            {"kind": kind, "channel": channel, "to": to, "params": params},
+            kind=kind,
+        )
@@ -0,0 +1,95 @@
+"""
+Async password hashing service
+Runs bcrypt hashing and verification on a dedicated thread pool so a burst of
+logins cannot stall the event loop. bcrypt releases the GIL while it works, so
+threads give real parallelism here.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+
+from utils.auth import hash_password, verify_password
+
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+# Requests beyond this many queued or running hashes are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+class PasswordHasher:
+    """Bounded bcrypt worker pool with queue-depth and latency counters."""
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_pending_seen = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="password-hash",
+            )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        """Hash a password using bcrypt off the event loop."""
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash off the event loop."""
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(1000 * self.total_seconds / self.completed, 2) if self.completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
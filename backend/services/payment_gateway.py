@@ -0,0 +1,144 @@
+"""
+Payment gateway adapters
+Async facade over the blocking Razorpay SDK, plus a local fake gateway so the
+checkout flow can be load-tested offline. Select with PAYMENT_GATEWAY=razorpay|fake.
+Signatures are verified locally (utils.signatures), not through the gateway.
+"""
+import asyncio
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.signatures import compute_payment_signature
+
+PAYMENT_GATEWAY = os.environ.get("PAYMENT_GATEWAY", "razorpay").strip().lower()
+# Concurrent SDK calls (also the size of the pooled HTTP connection pool)
+PAYMENT_GATEWAY_WORKERS = int(os.environ.get("PAYMENT_GATEWAY_WORKERS", "8"))
+PAYMENT_GATEWAY_TIMEOUT_SECONDS = float(os.environ.get("PAYMENT_GATEWAY_TIMEOUT_SECONDS", "15"))
+# Simulated round-trip for the fake gateway
+FAKE_GATEWAY_LATENCY_SECONDS = float(os.environ.get("FAKE_GATEWAY_LATENCY_SECONDS", "0.05"))
+# Orders the fake gateway remembers; a long load test would otherwise grow it forever
+FAKE_GATEWAY_MAX_ORDERS = int(os.environ.get("FAKE_GATEWAY_MAX_ORDERS", "10000"))
+
+
+class PaymentGatewayError(Exception):
+    """The gateway could not complete a request (timeout, HTTP or API error)."""
+
+
+class _TimeoutSession(requests.Session):
+    """requests session that applies a default timeout; the SDK never passes one."""
+
+    def __init__(self, timeout: float, pool_size: int):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(*args, **kwargs)
+
+
+class RazorpayGateway:
+    """Runs the synchronous Razorpay SDK on a bounded thread pool."""
+
+    def __init__(
+        self,
+        key_id: str,
+        key_secret: str,
+        workers: int = PAYMENT_GATEWAY_WORKERS,
+        timeout_seconds: float = PAYMENT_GATEWAY_TIMEOUT_SECONDS,
+    ):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.timeout_seconds = timeout_seconds
+        # Imported here so the SDK only loads when the real gateway is in use
+        import razorpay
+
+        self._client = razorpay.Client(
+            session=_TimeoutSession(timeout_seconds, workers),
+            auth=(key_id, key_secret),
+        )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="razorpay")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, func, *args),
+                # The HTTP timeout fires first; this also covers time spent queued
+                timeout=self.timeout_seconds * 2,
+            )
+        except asyncio.TimeoutError:
+            raise PaymentGatewayError("Razorpay request timed out")
+        except requests.RequestException as e:
+            raise PaymentGatewayError(f"Razorpay request failed: {e}")
+
+    async def create_order(self, data: dict) -> dict:
+        return await self._run(lambda: self._client.order.create(data=data))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class FakePaymentGateway:
+    """Offline stand-in that mimics Razorpay orders and HMAC signatures."""
+
+    def __init__(
+        self,
+        key_id: str = "rzp_test_fake",
+        key_secret: str = "fake_secret",
+        latency_seconds: float = FAKE_GATEWAY_LATENCY_SECONDS,
+        max_orders: int = FAKE_GATEWAY_MAX_ORDERS,
+    ):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.latency_seconds = latency_seconds
+        self.max_orders = max_orders
+        # Newest orders last; the oldest are dropped past max_orders
+        self.orders: "OrderedDict[str, dict]" = OrderedDict()
+
+    async def create_order(self, data: dict) -> dict:
+        await asyncio.sleep(self.latency_seconds)
+        order = {
+            "id": f"order_{uuid.uuid4().hex[:14]}",
+            "entity": "order",
+            "amount": data["amount"],
+            "currency": data["currency"],
+            "receipt": data.get("receipt"),
+            "notes": data.get("notes", {}),
+            "status": "created",
+        }
+        self.orders[order["id"]] = order
+        while len(self.orders) > self.max_orders:
+            self.orders.popitem(last=False)
+        return order
+
+    def sign_payment(self, razorpay_order_id: str, razorpay_payment_id: str) -> str:
+        """Signature Razorpay Checkout would hand the browser; used by load-test clients."""
+        return compute_payment_signature(razorpay_order_id, razorpay_payment_id, self.key_secret)
+
+    def shutdown(self) -> None:
+        self.orders.clear()
+
+
+def build_payment_gateway(key_id: str, key_secret: str) -> Optional[object]:
+    """Return the configured gateway, or None when payments are not set up."""
+    if PAYMENT_GATEWAY == "fake":
+        return FakePaymentGateway(
+            key_id=key_id or "rzp_test_fake",
+            key_secret=key_secret or "fake_secret",
+        )
+    if not (key_id and key_secret):
+        return None
+    try:
+        return RazorpayGateway(key_id, key_secret)
+    except ImportError:
+        print("Razorpay SDK not installed. Run: pip install razorpay")
+        return None
@@ -0,0 +1,299 @@
+"""
+In-process post catalog cache
+Keeps the posts collection in memory so the listing endpoint is served from RAM.
+The admin post routes patch the catalog in place; a TTL bounds staleness when
+several API replicas share one database.
+"""
+import asyncio
+import base64
+import bisect
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from models.post import PostResponse, PostPreviewResponse, build_preview
+from utils.http_cache import make_etag, http_date
+from utils.json_encoding import dumps
+
+POST_CACHE_TTL_SECONDS = float(os.environ.get("POST_CACHE_TTL_SECONDS", "60"))
+
+# Fields a listing request may ask for via ?fields=; "id" is always returned
+LISTING_FIELDS = tuple(PostPreviewResponse.model_fields)
+
+SortKey = Tuple[str, str]
+
+
+class PostVariants:
+    """One post revision with its full-access and preview bodies already encoded as JSON."""
+
+    __slots__ = (
+        "post",
+        "full_json",
+        "preview_json",
+        "full_listing_json",
+        "preview_listing_json",
+        "full_listing",
+        "preview_listing",
+        "full_etag",
+        "preview_etag",
+        "last_modified",
+    )
+
+    def __init__(self, post: dict):
+        self.post = post
+        is_premium = post.get("is_premium", True)
+        fields = {
+            "id": post["id"],
+            "title": post["title"],
+            "slug": post["slug"],
+            "excerpt": post["excerpt"],
+            "is_premium": is_premium,
+            "created_at": post["created_at"],
+            "updated_at": post["updated_at"],
+        }
+
+        full_listing = PostPreviewResponse(preview_content=post["content"], **fields)
+        self.full_json = PostResponse(content=post["content"], **fields).model_dump_json().encode()
+        self.full_listing_json = full_listing.model_dump_json().encode()
+        self.full_listing = full_listing.model_dump()
+
+        if is_premium:
+            preview = build_preview(post["content"])
+            preview_listing = PostPreviewResponse(preview_content=preview, **fields)
+            self.preview_json = PostResponse(content=preview, **fields).model_dump_json().encode()
+            self.preview_listing_json = preview_listing.model_dump_json().encode()
+            self.preview_listing = preview_listing.model_dump()
+        else:
+            self.preview_json = self.full_json
+            self.preview_listing_json = self.full_listing_json
+            self.preview_listing = self.full_listing
+
+        # Listing entries are derived from the same revision, so one tag per variant covers both
+        self.full_etag = make_etag(self.full_json)
+        self.preview_etag = make_etag(self.preview_json) if is_premium else self.full_etag
+        # Only when both variants are the same bytes: Last-Modified cannot tell them apart,
+        # so a reader who subscribes would revalidate their cached preview as still fresh
+        self.last_modified = http_date(post["updated_at"]) if self.full_etag == self.preview_etag else None
+
+    @property
+    def sort_key(self) -> SortKey:
+        return (self.post.get("created_at", ""), self.post["id"])
+
+    def detail_json(self, is_subscribed: bool) -> bytes:
+        """Body for GET /posts/{id}."""
+        return self.full_json if is_subscribed else self.preview_json
+
+    def listing_json(self, is_subscribed: bool) -> bytes:
+        """Body of this post's entry in GET /posts."""
+        return self.full_listing_json if is_subscribed else self.preview_listing_json
+
+    def etag(self, is_subscribed: bool) -> str:
+        """Strong ETag of the variant served to this reader."""
+        return self.full_etag if is_subscribed else self.preview_etag
+
+
+def encode_listing(
+    entries: List[PostVariants],
+    is_subscribed: bool,
+    fields: Optional[Sequence[str]] = None,
+) -> bytes:
+    """Join listing entries into a JSON array, optionally keeping only some fields."""
+    if not fields:
+        return b"[" + b",".join(entry.listing_json(is_subscribed) for entry in entries) + b"]"
+
+    projected = []
+    for entry in entries:
+        listing = entry.full_listing if is_subscribed else entry.preview_listing
+        projected.append({field: listing[field] for field in fields})
+    return dumps(projected)
+
+
+def listing_etag(
+    entries: List[PostVariants],
+    is_subscribed: bool,
+    fields: Optional[Sequence[str]] = None,
+    next_cursor: Optional[str] = None,
+) -> str:
+    """ETag of a listing page, derived from its entries' tags without encoding the body."""
+    parts = [
+        b"full" if is_subscribed else b"preview",
+        ",".join(fields or ()).encode(),
+        (next_cursor or "").encode(),
+    ]
+    parts.extend(entry.etag(is_subscribed).encode() for entry in entries)
+    return make_etag(*parts)
+
+
+def encode_cursor(key: SortKey) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[SortKey]:
+    """Decode a cursor produced by encode_cursor, or return None if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(created_at, str) or not isinstance(post_id, str):
+        return None
+    return (created_at, post_id)
+
+
+class PostCatalog:
+    """Versioned in-memory copy of the posts collection, newest first."""
+
+    def __init__(self, ttl_seconds: float = POST_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._posts: Dict[str, PostVariants] = {}
+        self._ordered: List[PostVariants] = []
+        self._ascending_keys: List[SortKey] = []
+        self._slug_to_id: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        if self.ttl_seconds <= 0:
+            return True
+        return time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    async def _load(self, db) -> None:
+        version_before = self.version
+        posts = await db.posts.find({}, {"_id": 0}).to_list(length=None)
+        if self.version != version_before:
+            # A write landed while we were reading; let the next caller reload.
+            return
+        entries = {post["id"]: self._reuse_or_build(post) for post in posts}
+        unchanged = entries.keys() == self._posts.keys() and all(
+            entry is self._posts[post_id] for post_id, entry in entries.items()
+        )
+        if not unchanged:
+            # A TTL refresh that finds nothing new keeps the version, so derived
+            # structures (search index) are not rebuilt
+            self._posts = entries
+            self._slug_to_id = {post["slug"]: post["id"] for post in posts}
+            self._reindex()
+        self._loaded_at = time.monotonic()
+
+    def _reuse_or_build(self, post: dict) -> PostVariants:
+        entry = self._posts.get(post["id"])
+        if entry is not None and entry.post == post:
+            return entry
+        return PostVariants(post)
+
+    def _reindex(self) -> None:
+        self._ordered = sorted(
+            self._posts.values(),
+            key=lambda entry: entry.sort_key,
+            reverse=True,
+        )
+        self._ascending_keys = [entry.sort_key for entry in reversed(self._ordered)]
+        self.version += 1
+
+    async def _ensure_loaded(self, db) -> bool:
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self._load(db)
+        return self._loaded_at is not None
+
+    async def list_posts(
+        self,
+        db,
+        limit: int,
+        after: Optional[SortKey] = None,
+    ) -> Tuple[List[PostVariants], Optional[SortKey]]:
+        """
+        Return one page of posts ordered by (created_at, id) descending, loading the
+        catalog if needed. ``after`` is the sort key of the last post already seen.
+        Also returns the sort key to continue from, or None on the last page.
+        """
+        if not await self._ensure_loaded(db):
+            # Lost a race with a write; serve this page straight from the database.
+            return await self._query_page(db, limit, after)
+
+        start = 0
+        if after is not None:
+            start = len(self._ordered) - bisect.bisect_left(self._ascending_keys, after)
+        page = self._ordered[start:start + limit]
+        has_more = start + limit < len(self._ordered)
+        return page, (page[-1].sort_key if page and has_more else None)
+
+    async def _query_page(
+        self,
+        db,
+        limit: int,
+        after: Optional[SortKey],
+    ) -> Tuple[List[PostVariants], Optional[SortKey]]:
+        query = {}
+        if after is not None:
+            created_at, post_id = after
+            query = {"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": post_id}},
+            ]}
+        posts = await db.posts.find(query, {"_id": 0}).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(length=None)
+        page = [PostVariants(post) for post in posts[:limit]]
+        return page, (page[-1].sort_key if len(posts) > limit else None)
+
+    async def snapshot(self, db) -> Tuple[Optional[int], List[PostVariants]]:
+        """
+        Every post, newest first, with the catalog version it belongs to. If a write
+        won the race the posts come straight from the database and the version is None.
+        """
+        if await self._ensure_loaded(db):
+            return self.version, self._ordered
+        posts = await db.posts.find({}, {"_id": 0}).to_list(length=None)
+        return None, [PostVariants(post) for post in posts]
+
+    def variants_for(self, post: dict) -> PostVariants:
+        """Return cached variants for a post document, building them if the revision is new."""
+        entry = self._posts.get(post["id"])
+        if entry is not None and entry.post.get("updated_at") == post.get("updated_at"):
+            return entry
+        return PostVariants(post)
+
+    def resolve_id(self, key: str) -> Optional[str]:
+        """Map a post id or slug to a known post id. Only a hint: the database is authoritative."""
+        if key in self._posts:
+            return key
+        return self._slug_to_id.get(key)
+
+    def _drop_slug(self, post_id: str) -> None:
+        stale = [slug for slug, known_id in self._slug_to_id.items() if known_id == post_id]
+        for slug in stale:
+            del self._slug_to_id[slug]
+
+    def upsert(self, post: dict) -> None:
+        """Insert or replace a post after it has been written to the database."""
+        self._drop_slug(post["id"])
+        self._slug_to_id[post["slug"]] = post["id"]
+        if self._loaded_at is None:
+            self.invalidate()
+            return
+        self._posts[post["id"]] = PostVariants(post)
+        self._reindex()
+
+    def remove(self, post_id: str) -> None:
+        """Drop a post after it has been deleted from the database."""
+        self._drop_slug(post_id)
+        if self._loaded_at is None:
+            self.invalidate()
+            return
+        if self._posts.pop(post_id, None) is not None:
+            self._reindex()
+
+    def invalidate(self) -> None:
+        """Force the next read to reload from the database."""
+        self._loaded_at = None
+        self.version += 1
+
+
+post_catalog = PostCatalog()
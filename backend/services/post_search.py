@@ -0,0 +1,261 @@
+"""
+Post full-text search
+Ranks posts by title, excerpt and content with a weighted MongoDB text index, or
+with an in-process inverted index built from the post catalog for small deployments
+(POST_SEARCH_BACKEND=mongo|memory). Non-subscribers are matched and ranked against
+the text they may see: premium posts only count their preview, so neither the hits
+nor their order reveal the gated part of an essay. In Mongo mode that text lives in
+a post_previews collection with its own text index (a collection holds only one).
+"""
+import html
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+from models.post import build_preview
+from services.post_cache import PostVariants, post_catalog
+
+POST_SEARCH_BACKEND = os.environ.get("POST_SEARCH_BACKEND", "mongo").strip().lower()
+POST_SEARCH_SNIPPET_CHARS = int(os.environ.get("POST_SEARCH_SNIPPET_CHARS", "200"))
+
+# Relative field weights, shared by the Mongo index and the in-memory scorer
+FIELD_WEIGHTS = {"title": 10, "excerpt": 4, "content": 1}
+TEXT_INDEX_NAME = "posts_text"
+PREVIEW_COLLECTION = "post_previews"
+
+WORD = re.compile(r"\w+")
+TAG = re.compile(r"<[^>]+>")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with".split()
+)
+# Crude suffix stripping so "experiments" finds "experiment"; Mongo stems properly
+SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased, stemmed search terms of a text, without stopwords."""
+    return [stem(word) for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def visible_text(markup: str) -> str:
+    """Plain text of a post body: tags stripped, entities decoded, whitespace collapsed."""
+    return " ".join(html.unescape(TAG.sub(" ", markup)).split())
+
+
+def highlight(text: str, query_terms: Set[str], length: int = POST_SEARCH_SNIPPET_CHARS) -> Optional[str]:
+    """
+    Cut a window of plain text around the first query match and return it
+    HTML-escaped with every match wrapped in <mark>, or None if nothing matches.
+    """
+    matches = [m for m in WORD.finditer(text) if stem(m.group().lower()) in query_terms]
+    if not matches:
+        return None
+
+    start = max(0, matches[0].start() - length // 3)
+    if start > 0:
+        # Begin on a word boundary
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < matches[0].start() else matches[0].start()
+    end = min(len(text), start + length)
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > matches[0].end() else end
+
+    parts = ["…"] if start > 0 else []
+    cursor = start
+    for match in matches:
+        if match.start() < start:
+            continue
+        if match.end() > end:
+            break
+        parts.append(html.escape(text[cursor:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        cursor = match.end()
+    parts.append(html.escape(text[cursor:end]))
+    if end < len(text):
+        parts.append("…")
+    return "".join(parts)
+
+
+def visible_content(post: dict, is_subscribed: bool) -> str:
+    """The part of a post's content this reader may see."""
+    content = post.get("content", "")
+    if post.get("is_premium", True) and not is_subscribed:
+        return build_preview(content)
+    return content
+
+
+def preview_document(post: dict) -> dict:
+    """A post as non-subscribers see it, for the post_previews text index."""
+    return {
+        "id": post["id"],
+        "title": post.get("title", ""),
+        "excerpt": post.get("excerpt", ""),
+        "content": visible_text(visible_content(post, False)),
+    }
+
+
+def build_snippet(post: dict, query_terms: Set[str], is_subscribed: bool) -> str:
+    """Snippet from the content the reader is allowed to see, falling back to the excerpt."""
+    content = visible_content(post, is_subscribed)
+    for source in (content, post.get("excerpt", "")):
+        snippet = highlight(visible_text(source), query_terms)
+        if snippet is not None:
+            return snippet
+    excerpt = visible_text(post.get("excerpt", ""))
+    if len(excerpt) <= POST_SEARCH_SNIPPET_CHARS:
+        return html.escape(excerpt)
+    return html.escape(excerpt[:POST_SEARCH_SNIPPET_CHARS].rsplit(" ", 1)[0]) + "…"
+
+
+def search_result(post: dict, score: float, query_terms: Set[str], is_subscribed: bool) -> dict:
+    return {
+        "id": post["id"],
+        "title": post["title"],
+        "slug": post["slug"],
+        "excerpt": post["excerpt"],
+        "is_premium": post.get("is_premium", True),
+        "created_at": post["created_at"],
+        "snippet": build_snippet(post, query_terms, is_subscribed),
+        "score": round(score, 4),
+    }
+
+
+class InvertedIndex:
+    """
+    term -> {post id: weighted term frequency}, built once per catalog revision.
+    With preview_only, premium posts are indexed by their preview, as
+    non-subscribers see them.
+    """
+
+    def __init__(self, entries: Iterable[PostVariants], preview_only: bool = False):
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.posts: Dict[str, dict] = {}
+        for entry in entries:
+            post = entry.post
+            self.posts[post["id"]] = post
+            counts: Dict[str, float] = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                if field == "content":
+                    text = visible_text(visible_content(post, not preview_only))
+                else:
+                    text = post.get(field, "")
+                for term in terms(text):
+                    counts[term] = counts.get(term, 0) + weight
+            for term, weighted in counts.items():
+                # Damped so one long essay repeating a word does not swamp the title match
+                self.postings.setdefault(term, {})[post["id"]] = 1 + math.log(weighted)
+
+    def search(self, query_terms: Set[str], limit: int) -> List[tuple]:
+        """Posts matching any term, as (score, post) pairs, best first."""
+        scores: Dict[str, float] = {}
+        total = len(self.posts)
+        for term in query_terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for post_id, weight in postings.items():
+                scores[post_id] = scores.get(post_id, 0.0) + weight * idf
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (item[1], self.posts[item[0]].get("created_at", "")),
+            reverse=True,
+        )
+        return [(score, self.posts[post_id]) for post_id, score in ranked[:limit]]
+
+
+class PostSearch:
+    """Runs queries against the configured backend and shapes the results."""
+
+    def __init__(self, backend: str = POST_SEARCH_BACKEND):
+        self.backend = backend
+        # Keyed by preview_only; both are built for the same catalog version
+        self._indexes: Dict[bool, InvertedIndex] = {}
+        self._indexed_version: Optional[int] = None
+
+    async def ensure_indexes(self, db) -> None:
+        if self.backend != "mongo":
+            return
+        for collection in (db.posts, db[PREVIEW_COLLECTION]):
+            await collection.create_index(
+                [(field, "text") for field in FIELD_WEIGHTS],
+                weights=FIELD_WEIGHTS,
+                name=TEXT_INDEX_NAME,
+                default_language="english",
+            )
+        await db[PREVIEW_COLLECTION].create_index("id", unique=True)
+        await self.sync_previews(db)
+
+    async def sync_previews(self, db) -> None:
+        """Rebuild post_previews from the posts collection (startup, or after a preview rule change)."""
+        posts = await db.posts.find({}, {"_id": 0}).to_list(length=None)
+        for post in posts:
+            await self.index_post(db, post)
+        await db[PREVIEW_COLLECTION].delete_many({"id": {"$nin": [post["id"] for post in posts]}})
+
+    async def index_post(self, db, post: dict) -> None:
+        """Keep the preview text of a created or edited post searchable."""
+        if self.backend == "mongo":
+            await db[PREVIEW_COLLECTION].replace_one({"id": post["id"]}, preview_document(post), upsert=True)
+
+    async def remove_post(self, db, post_id: str) -> None:
+        if self.backend == "mongo":
+            await db[PREVIEW_COLLECTION].delete_one({"id": post_id})
+
+    async def _mongo_search(self, db, query: str, limit: int, is_subscribed: bool) -> List[tuple]:
+        projection = {"_id": 0, "score": {"$meta": "textScore"}}
+        if not is_subscribed:
+            # Only ids and scores from the preview index; the posts are read afterwards
+            projection["id"] = 1
+        collection = db.posts if is_subscribed else db[PREVIEW_COLLECTION]
+        cursor = collection.find({"$text": {"$search": query}}, projection).sort(
+            [("score", {"$meta": "textScore"})]
+        ).limit(limit)
+        hits = [(doc.pop("score"), doc) for doc in await cursor.to_list(length=limit)]
+        if is_subscribed:
+            return hits
+
+        posts = await db.posts.find(
+            {"id": {"$in": [doc["id"] for _, doc in hits]}}, {"_id": 0}
+        ).to_list(length=limit)
+        by_id = {post["id"]: post for post in posts}
+        return [(score, by_id[doc["id"]]) for score, doc in hits if doc["id"] in by_id]
+
+    async def _memory_index(self, db, preview_only: bool) -> InvertedIndex:
+        version, entries = await post_catalog.snapshot(db)
+        if version is None:
+            # Posts read around a concurrent write; index them once without caching
+            return InvertedIndex(entries, preview_only)
+        if version != self._indexed_version:
+            self._indexes = {}
+            self._indexed_version = version
+        index = self._indexes.get(preview_only)
+        if index is None:
+            index = self._indexes[preview_only] = InvertedIndex(entries, preview_only)
+        return index
+
+    async def search(self, db, query: str, limit: int, is_subscribed: bool) -> List[dict]:
+        query_terms = set(terms(query))
+        if not query_terms:
+            return []
+
+        if self.backend == "memory":
+            index = await self._memory_index(db, preview_only=not is_subscribed)
+            hits = index.search(query_terms, limit)
+        else:
+            hits = await self._mongo_search(db, query, limit, is_subscribed)
+
+        return [search_result(post, score, query_terms, is_subscribed) for score, post in hits]
+
+
+post_search = PostSearch()
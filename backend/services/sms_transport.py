@@ -0,0 +1,177 @@
+"""
+SMS transports
+Async-native Twilio client over a shared httpx connection pool, with timeouts and a
+cap on in-flight sends, plus offline transports for development and load tests.
+Select with SMS_TRANSPORT=twilio|fake|console.
+"""
+import asyncio
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional
+
+import httpx
+
+from utils.stats import latency_summary
+
+SMS_TRANSPORT = os.environ.get("SMS_TRANSPORT", "").strip().lower()
+# Sends allowed in flight at once (also the HTTP connection pool size)
+SMS_MAX_CONCURRENCY = int(os.environ.get("SMS_MAX_CONCURRENCY", "10"))
+SMS_TIMEOUT_SECONDS = float(os.environ.get("SMS_TIMEOUT_SECONDS", "10"))
+# Simulated round-trip for the fake transport
+FAKE_SMS_LATENCY_SECONDS = float(os.environ.get("FAKE_SMS_LATENCY_SECONDS", "0.05"))
+
+TWILIO_API_BASE = "https://api.twilio.com/2010-04-01"
+
+
+class SmsTransportError(Exception):
+    """The provider rejected the message or could not be reached."""
+
+
+class SmsTransport(ABC):
+    """Base for transports: caps in-flight sends and records counters and latencies."""
+
+    name: str
+
+    def __init__(self, max_concurrency: int = SMS_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=1000)
+
+    async def send(self, to: str, from_: str, body: str) -> str:
+        """Send one message and return the provider message id."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                message_id = await self._send(to, from_, body)
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self._latencies.append(time.perf_counter() - started)
+            self.sent += 1
+            return message_id
+
+    @abstractmethod
+    async def _send(self, to: str, from_: str, body: str) -> str:
+        """Deliver one message through the provider and return its message id."""
+
+    def stats(self) -> dict:
+        return {
+            "transport": self.name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "latency": latency_summary(self._latencies),
+        }
+
+    async def aclose(self) -> None:
+        pass
+
+
+class TwilioSmsTransport(SmsTransport):
+    """Calls the Twilio Messages REST API directly over a pooled httpx client."""
+
+    name = "twilio"
+
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        max_concurrency: int = SMS_MAX_CONCURRENCY,
+        timeout_seconds: float = SMS_TIMEOUT_SECONDS,
+        http_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        super().__init__(max_concurrency)
+        self.account_sid = account_sid
+        self._auth = (account_sid, auth_token)
+        self.timeout_seconds = timeout_seconds
+        # Overrides httpx's pooled transport (e.g. httpx.MockTransport in tests)
+        self._http_transport = http_transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"{TWILIO_API_BASE}/Accounts/{self.account_sid}",
+                auth=self._auth,
+                timeout=httpx.Timeout(self.timeout_seconds),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self._http_transport,
+            )
+        return self._client
+
+    async def _send(self, to: str, from_: str, body: str) -> str:
+        try:
+            response = await self._get_client().post(
+                "/Messages.json",
+                data={"To": to, "From": from_, "Body": body},
+            )
+        except httpx.HTTPError as e:
+            raise SmsTransportError(f"Twilio request failed: {e}")
+
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("message", response.text)
+            except ValueError:
+                detail = response.text
+            raise SmsTransportError(f"Twilio error {response.status_code}: {detail}")
+        return response.json().get("sid", "")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeSmsTransport(SmsTransport):
+    """Sleeps for FAKE_SMS_LATENCY_SECONDS per message; for load-testing the expiry job."""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        max_concurrency: int = SMS_MAX_CONCURRENCY,
+        latency_seconds: float = FAKE_SMS_LATENCY_SECONDS,
+    ):
+        super().__init__(max_concurrency)
+        self.latency_seconds = latency_seconds
+
+    async def _send(self, to: str, from_: str, body: str) -> str:
+        await asyncio.sleep(self.latency_seconds)
+        return f"SM{uuid.uuid4().hex}"
+
+
+class ConsoleSmsTransport(SmsTransport):
+    """Logs each SMS to stdout; used when Twilio credentials are missing."""
+
+    name = "console"
+
+    async def _send(self, to: str, from_: str, body: str) -> str:
+        print(f"[DEV MODE] SMS would be sent to {to}")
+        print(f"Message: {body}")
+        return "dev"
+
+
+def build_sms_transport(account_sid: str, auth_token: str, from_number: str) -> SmsTransport:
+    """Return the configured transport; falls back to the console when Twilio is not set up."""
+    if SMS_TRANSPORT == "fake":
+        return FakeSmsTransport()
+    if SMS_TRANSPORT == "console":
+        return ConsoleSmsTransport()
+    if account_sid and auth_token and from_number:
+        return TwilioSmsTransport(account_sid, auth_token)
+    return ConsoleSmsTransport()
@@ -0,0 +1,220 @@
+"""
+Upload storage backends
+Uploaded images and their derivatives are written through a storage driver so API
+replicas can share them: the local filesystem (default) or any S3-compatible object
+store (AWS S3, MinIO, R2). Select with STORAGE_BACKEND=local|s3.
+"""
+import asyncio
+import os
+import shutil
+from typing import Optional
+
+from fastapi.responses import RedirectResponse
+
+from utils.http_cache import IMMUTABLE_CACHE_CONTROL
+from utils.static_files import CONTENT_HASHED_NAME
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local").strip().lower()
+
+UPLOAD_DIR = os.environ.get(
+    "UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads"),
+)
+# Incoming files are streamed here before they are hashed and handed to the driver
+UPLOAD_STAGING_DIR = os.environ.get(
+    "UPLOAD_STAGING_DIR",
+    os.path.join(os.path.dirname(UPLOAD_DIR), ".upload-staging"),
+)
+
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+S3_REGION = os.environ.get("S3_REGION") or None
+S3_PREFIX = os.environ.get("S3_PREFIX", "uploads/")
+# Public origin (CDN or bucket website) that serves the objects; without one,
+# clients are redirected to presigned URLs valid for S3_PRESIGN_SECONDS
+S3_PUBLIC_BASE_URL = os.environ.get("S3_PUBLIC_BASE_URL", "").rstrip("/")
+S3_PRESIGN_SECONDS = int(os.environ.get("S3_PRESIGN_SECONDS", "3600"))
+S3_MULTIPART_CHUNK_BYTES = int(os.environ.get("S3_MULTIPART_CHUNK_BYTES", str(8 * 1024 * 1024)))
+S3_UPLOAD_CONCURRENCY = int(os.environ.get("S3_UPLOAD_CONCURRENCY", "4"))
+# Presigned URLs expire, so a redirect to one may only be cached briefly
+PRESIGNED_REDIRECT_CACHE_CONTROL = "private, max-age=300"
+
+
+class LocalStorage:
+    """Stores objects as files under one directory, served by the /uploads mount."""
+
+    name = "local"
+    # public_url() never changes for a key, so redirects to it may be cached for good
+    stable_urls = True
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "derived"), exist_ok=True)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.root, key)
+
+    def public_url(self, key: str) -> str:
+        return f"/uploads/{key}"
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    async def put_file(self, source_path: str, key: str, content_type: str, move: bool = False) -> None:
+        target = self.local_path(key)
+        if move:
+            # Staging lives on the same filesystem, so this is a rename
+            await asyncio.to_thread(shutil.move, source_path, target)
+        else:
+            await asyncio.to_thread(shutil.copyfile, source_path, target)
+
+    async def put_bytes(self, data: bytes, key: str, content_type: str) -> None:
+        def write():
+            temp_path = f"{self.local_path(key)}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.local_path(key))
+
+        await asyncio.to_thread(write)
+
+    async def read_bytes(self, key: str) -> Optional[bytes]:
+        def read():
+            try:
+                with open(self.local_path(key), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+
+        return await asyncio.to_thread(read)
+
+
+class S3Storage:
+    """S3-compatible object storage; large files go up as multipart uploads."""
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        prefix: str = S3_PREFIX,
+        public_base_url: str = S3_PUBLIC_BASE_URL,
+        multipart_chunk_bytes: int = S3_MULTIPART_CHUNK_BYTES,
+    ):
+        # Imported here so boto3 only loads when the S3 driver is in use
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_base_url = public_base_url
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(max_pool_connections=max(10, S3_UPLOAD_CONCURRENCY * 2)),
+        )
+        self._transfer_config = TransferConfig(
+            multipart_threshold=multipart_chunk_bytes,
+            multipart_chunksize=multipart_chunk_bytes,
+            max_concurrency=S3_UPLOAD_CONCURRENCY,
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    @property
+    def stable_urls(self) -> bool:
+        return bool(self.public_base_url)
+
+    def public_url(self, key: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self._key(key)}"
+        # Presigning is a local HMAC computation, no request to the store
+        return self._client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=S3_PRESIGN_SECONDS,
+        )
+
+    def redirect(self, key: str) -> RedirectResponse:
+        """
+        Send a client from /uploads/{key} to the object. Content-hashed keys behind a
+        stable public origin get a permanent, immutable redirect; anything else
+        (presigned URLs, legacy names) a short-lived 302.
+        """
+        if self.stable_urls and CONTENT_HASHED_NAME.match(key.rsplit("/", 1)[-1]):
+            return RedirectResponse(
+                self.public_url(key),
+                status_code=301,
+                headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL},
+            )
+        return RedirectResponse(
+            self.public_url(key),
+            status_code=302,
+            headers={"Cache-Control": PRESIGNED_REDIRECT_CACHE_CONTROL},
+        )
+
+    async def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            await asyncio.to_thread(self._client.head_object, Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def put_file(self, source_path: str, key: str, content_type: str, move: bool = False) -> None:
+        # upload_file streams from disk and switches to parallel multipart above the threshold
+        await asyncio.to_thread(
+            self._client.upload_file,
+            source_path,
+            self.bucket,
+            self._key(key),
+            ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+            Config=self._transfer_config,
+        )
+        if move:
+            os.remove(source_path)
+
+    async def put_bytes(self, data: bytes, key: str, content_type: str) -> None:
+        await asyncio.to_thread(
+            self._client.put_object,
+            Bucket=self.bucket,
+            Key=self._key(key),
+            Body=data,
+            ContentType=content_type,
+        )
+
+    async def read_bytes(self, key: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+
+        def read():
+            try:
+                response = self._client.get_object(Bucket=self.bucket, Key=self._key(key))
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return None
+                raise
+            return response["Body"].read()
+
+        return await asyncio.to_thread(read)
+
+
+def build_storage():
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Storage()
+    return LocalStorage()
+
+
+os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+storage = build_storage()
@@ -1,18 +1,104 @@
+import hashlib
+import mimetypes
 import os
-from fastapi import UploadFile
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile
 from uuid import uuid4
 import aiofiles
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+from services.storage import UPLOAD_DIR, UPLOAD_STAGING_DIR, storage
+
+# Uploads larger than this are rejected with 413 as soon as the limit is crossed
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Leading bytes of the image formats we accept, mapped to the extension we store
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+CONTENT_TYPES = {".avif": "image/avif", ".webp": "image/webp"}
+
+
+def sniff_image_extension(head: bytes):
+    """Return the file extension for a supported image, judged by its first bytes."""
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return ".avif"
+    return None
+
+
+@dataclass
+class StagedUpload:
+    """A received upload on local disk, named by content hash but not yet stored."""
+
+    filename: str
+    path: str
+    content_type: str
+    size: int
+
+    def discard(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def stage_upload_file(upload_file: UploadFile) -> StagedUpload:
+    """
+    Stream an uploaded image to the staging directory in fixed-size chunks so memory
+    stays flat regardless of file size. The type comes from the file's magic bytes,
+    not the client-supplied name or content type. The name is the SHA-256 of the
+    content, so identical uploads share one object and a URL never changes meaning.
+    """
+    first_chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+    ext = sniff_image_extension(first_chunk)
+    if ext is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported image type. Upload a JPEG, PNG, GIF, WebP or AVIF file.",
+        )
+
+    temp_path = os.path.join(UPLOAD_STAGING_DIR, f"{uuid4().hex}.part")
+    digest = hashlib.sha256()
+    written = 0
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            chunk = first_chunk
+            while chunk:
+                written += len(chunk)
+                if written > UPLOAD_MAX_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Image is larger than the {UPLOAD_MAX_BYTES / (1024 * 1024):.1f} MB limit",
+                    )
+                digest.update(chunk)
+                await buffer.write(chunk)
+                chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+    except BaseException:
+        # Don't leave partial files behind on rejection, error or cancellation
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    content_type = CONTENT_TYPES.get(ext) or mimetypes.guess_type(f"x{ext}")[0]
+    return StagedUpload(f"{digest.hexdigest()}{ext}", temp_path, content_type, written)
+
+
+async def store_staged_upload(staged: StagedUpload) -> str:
+    """Hand a staged upload to the storage driver; identical content is stored once."""
+    try:
+        if not await storage.exists(staged.filename):
+            await storage.put_file(staged.path, staged.filename, staged.content_type, move=True)
+    finally:
+        staged.discard()
+    return staged.filename
+
 
 async def save_upload_file(upload_file: UploadFile) -> str:
-    ext = os.path.splitext(upload_file.filename)[-1]
-    filename = f"{uuid4().hex}{ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    async with aiofiles.open(file_path, "wb") as buffer:
-        content = await upload_file.read()
-        await buffer.write(content)
-    
-    return filename
+    return await store_staged_upload(await stage_upload_file(upload_file))
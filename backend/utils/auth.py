@@ -3,6 +3,7 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import os
+import uuid
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -12,6 +13,11 @@ SECRET_KEY = os.environ.get("JWT_SECRET", "faith-by-experiments-secret-key-chang
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
 
+# Opt-in: embed subscription claims in short-lived access tokens, paired with refresh tokens
+SUBSCRIPTION_CLAIMS_ENABLED = os.environ.get("JWT_SUBSCRIPTION_CLAIMS", "").lower() in ("1", "true", "yes")
+CLAIMS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("CLAIMS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = ACCESS_TOKEN_EXPIRE_DAYS
+
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
@@ -35,6 +41,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def create_refresh_token(user_id: str, token_version: int = 0) -> str:
+    """
+    Create a long-lived JWT that can only be exchanged for a new access token.
+    The jti makes each refresh token single-use; token_version ties it to the
+    user's current sessions, so bumping the version revokes it.
+    """
+    return create_access_token(
+        data={"sub": user_id, "typ": "refresh", "ver": token_version, "jti": uuid.uuid4().hex},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+
+
 def decode_token(token: str) -> Optional[dict]:
     """Decode and verify a JWT token."""
     try:
@@ -0,0 +1,352 @@
+"""
+HTTP response compression
+Brotli/gzip negotiation, a pure ASGI middleware that compresses dynamic responses,
+and a byte-bounded cache of compressed bodies keyed by (ETag, encoding) so cached
+post variants are compressed once, at the slowest levels, and reused.
+Brotli is optional; without it responses fall back to gzip.
+"""
+import asyncio
+import os
+import zlib
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from utils.http_cache import add_vary, coded_etag
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+# Bodies smaller than this are sent as-is; framing overhead eats the savings
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+# Per-request levels for dynamic responses: fast, most of the ratio
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_LEVEL = int(os.environ.get("COMPRESSION_BROTLI_LEVEL", "5"))
+# Bodies (or stream chunks) at least this large are compressed in a worker thread;
+# below it the hand-off costs more than compressing on the event loop
+COMPRESSION_THREAD_MIN_BYTES = int(os.environ.get("COMPRESSION_THREAD_MIN_BYTES", str(64 * 1024)))
+# Cached bodies are compressed once, so they can afford the maximum levels
+COMPRESSION_CACHED_GZIP_LEVEL = int(os.environ.get("COMPRESSION_CACHED_GZIP_LEVEL", "9"))
+COMPRESSION_CACHED_BROTLI_LEVEL = int(os.environ.get("COMPRESSION_CACHED_BROTLI_LEVEL", "11"))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get("COMPRESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Encodings we can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported content coding for an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip()] = q
+
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressedBodyCache:
+    """
+    Byte-bounded LRU of compressed bodies keyed by (ETag, encoding). Concurrent
+    misses for one key share a single compression job.
+    """
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, etag: str, encoding: str) -> Optional[bytes]:
+        key = (etag, encoding)
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._entries
+
+    async def compress(self, etag: str, encoding: str, body: bytes) -> bytes:
+        """Compress a body at the cached level and remember it under its ETag."""
+        key = (etag, encoding)
+        job = self._pending.get(key)
+        if job is None:
+            level = COMPRESSION_CACHED_BROTLI_LEVEL if encoding == "br" else COMPRESSION_CACHED_GZIP_LEVEL
+            # Maximum levels take ~100 ms on a full listing page; keep them off the loop,
+            # and run them once even when a post edit sends a burst of requests here
+            job = asyncio.ensure_future(asyncio.to_thread(compress, body, encoding, level))
+            job.add_done_callback(partial(self._finish, key))
+            self._pending[key] = job
+        else:
+            self.coalesced += 1
+        # Shielded so one cancelled request does not cancel the job for the others
+        return await asyncio.shield(job)
+
+    def _finish(self, key: Tuple[str, str], job: asyncio.Future) -> None:
+        self._pending.pop(key, None)
+        if not job.cancelled() and job.exception() is None:
+            self._put(key, job.result())
+
+    def _put(self, key: Tuple[str, str], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._pending),
+        }
+
+
+compressed_bodies = CompressedBodyCache()
+
+
+async def encoded_response(
+    etag: str,
+    accept_encoding: Optional[str],
+    render: Callable[[], bytes],
+    media_type: str = "application/json",
+) -> Response:
+    """
+    Response for a body identified by a strong ETag. Compressed bytes come from the
+    cache, so a hit skips both rendering and compression. Each coding is sent with
+    its own strong tag (coded_etag), since the bytes differ per coding.
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    content = compressed_bodies.get(etag, encoding) if encoding else None
+    if content is None:
+        body = render()
+        if encoding and len(body) >= COMPRESSION_MIN_BYTES:
+            content = await compressed_bodies.compress(etag, encoding, body)
+        else:
+            content, encoding = body, None
+
+    response = Response(content=content, media_type=media_type)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["ETag"] = coded_etag(etag, encoding)
+    add_vary(response.headers, "Accept-Encoding")
+    return response
+
+
+def not_modified_response(etag: str, accept_encoding: Optional[str]) -> Response:
+    """304 for a body served by encoded_response, carrying the tag a 200 would have."""
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding and (etag, encoding) not in compressed_bodies:
+        # Below the size threshold (or evicted): the 200 would be identity-coded
+        encoding = None
+    response = Response(status_code=304)
+    response.headers["ETag"] = coded_etag(etag, encoding)
+    add_vary(response.headers, "Accept-Encoding")
+    return response
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str, level: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+            self.compress = self._compressor.process
+            self.finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self.finish = self._compressor.flush
+
+
+class CompressionMiddleware:
+    """
+    Compresses text and JSON responses for clients that accept br or gzip.
+    Responses that already carry a Content-Encoding (the cached post variants),
+    small bodies, and binary types such as images pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_BYTES,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_level: int = COMPRESSION_BROTLI_LEVEL,
+        thread_min_size: int = COMPRESSION_THREAD_MIN_BYTES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+        self.levels = {"gzip": gzip_level, "br": brotli_level}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        responder = _CompressionResponder(
+            send, encoding, self.levels.get(encoding), self.minimum_size, self.thread_min_size
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Per-request send wrapper; holds the start message until the body size is known."""
+
+    def __init__(
+        self,
+        send,
+        encoding: Optional[str],
+        level: Optional[int],
+        minimum_size: int,
+        thread_min_size: int = COMPRESSION_THREAD_MIN_BYTES,
+    ):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+        self.start_message = None
+        self.passthrough = False
+        self.compressor: Optional[_StreamCompressor] = None
+
+    def _eligible(self, status: int, headers: Headers) -> bool:
+        if status < 200 or status in (204, 304):
+            return False
+        if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+            return False
+        if not is_compressible(headers.get("content-type")):
+            return False
+        content_length = headers.get("content-length")
+        return content_length is None or int(content_length) >= self.minimum_size
+
+    async def _start(self, encoding: Optional[str], content_length: Optional[int] = None) -> None:
+        message = self.start_message
+        self.start_message = None
+        headers = MutableHeaders(raw=message["headers"])
+        add_vary(headers, "Accept-Encoding")
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Compressed bytes differ from the identity bytes the strong tag names
+                headers["ETag"] = f"W/{etag}"
+            if content_length is None:
+                del headers["content-length"]
+            else:
+                headers["Content-Length"] = str(content_length)
+        await self._send(message)
+
+    async def _compress(self, fn, body: bytes, *args) -> bytes:
+        # Large bodies would stall every other request on the loop for milliseconds
+        if len(body) >= self.thread_min_size:
+            return await asyncio.to_thread(fn, body, *args)
+        return fn(body, *args)
+
+    async def send(self, message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            if self._eligible(message["status"], Headers(raw=message["headers"])):
+                self.start_message = message
+            else:
+                self.passthrough = True
+                await self._send(message)
+            return
+
+        if self.passthrough or message_type != "http.response.body":
+            # Anything else (e.g. pathsend for file responses) is sent as-is
+            if self.start_message is not None:
+                self.passthrough = True
+                await self._send(self.start_message)
+                self.start_message = None
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body:
+                if self.encoding and len(body) >= self.minimum_size:
+                    body = await self._compress(compress, body, self.encoding, self.level)
+                    await self._start(self.encoding, len(body))
+                    message = {"type": "http.response.body", "body": body}
+                elif len(body) >= self.minimum_size:
+                    await self._start(None)
+                else:
+                    self.passthrough = True
+                    await self._send(self.start_message)
+                    self.start_message = None
+                await self._send(message)
+                return
+
+            # Streaming body of unknown length
+            if not self.encoding:
+                self.passthrough = True
+                await self._start(None)
+                await self._send(message)
+                return
+            self.compressor = _StreamCompressor(self.encoding, self.level)
+            await self._start(self.encoding)
+
+        data = await self._compress(self.compressor.compress, body)
+        if not more_body:
+            data += self.compressor.finish()
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
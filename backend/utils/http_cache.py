@@ -0,0 +1,110 @@
+from fastapi import Response
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+import hashlib
+
+# For URLs whose bytes can never change (content-hashed file names)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Content codings whose representations get their own strong ETag ("<tag>-br")
+CODED_ETAG_SUFFIXES = ("-br", "-gzip")
+
+
+def make_etag(*parts: bytes) -> str:
+    """Build a strong ETag from the bytes that determine a representation."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return f'"{digest.hexdigest()}"'
+
+
+def coded_etag(etag: str, coding: Optional[str]) -> str:
+    """Strong ETag of one content-coded representation of the body tagged ``etag``."""
+    if not coding:
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def _strip_coding(etag: str) -> str:
+    for suffix in CODED_ETAG_SUFFIXES:
+        if etag.endswith(f'{suffix}"'):
+            return f'{etag[:-len(suffix) - 1]}"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison, per RFC 9110).
+    A tag for any content coding of the same body (see coded_etag) also matches.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag or _strip_coding(candidate) == etag:
+            return True
+    return False
+
+
+def http_date(iso_timestamp: str) -> Optional[str]:
+    """Format a stored ISO timestamp as an HTTP date, or None if it cannot be parsed."""
+    try:
+        moment = datetime.fromisoformat(iso_timestamp.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: Optional[str]) -> bool:
+    """Check an If-Modified-Since header against a Last-Modified HTTP date."""
+    if not if_modified_since or not last_modified:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+        modified = parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return modified <= since
+
+
+def is_not_modified(
+    etag: str,
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> bool:
+    """Evaluate conditional GET headers; If-None-Match takes precedence when present."""
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    return not_modified_since(if_modified_since, last_modified)
+
+
+def add_vary(headers, field: str) -> None:
+    """Add a field to a response's Vary header, keeping any already listed."""
+    existing = headers.get("vary")
+    if not existing:
+        headers["Vary"] = field
+    elif field.lower() not in (item.strip().lower() for item in existing.split(",")):
+        headers["Vary"] = f"{existing}, {field}"
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[str] = None) -> Response:
+    """
+    Attach caching validators to a response whose body depends on the Authorization
+    header. An ETag already set for a content-coded body is kept.
+    """
+    response.headers.setdefault("ETag", etag)
+    if last_modified:
+        response.headers["Last-Modified"] = last_modified
+    response.headers["Cache-Control"] = "no-cache"
+    add_vary(response.headers, "Authorization")
+    return response
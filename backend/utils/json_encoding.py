@@ -0,0 +1,27 @@
+"""
+Fast JSON encoding
+orjson-backed default response class and dumps() for the API, falling back to the
+stdlib encoder (FastAPI's JSONResponse) when orjson is not installed.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Optional dependency
+    orjson = None
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as APIJSONResponse
+
+    def dumps(value: Any) -> bytes:
+        """Compact UTF-8 JSON, as the response class renders it."""
+        return orjson.dumps(value)
+else:
+    APIJSONResponse = JSONResponse
+
+    def dumps(value: Any) -> bytes:
+        """Compact UTF-8 JSON, as the response class renders it."""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
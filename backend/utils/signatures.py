@@ -0,0 +1,38 @@
+import hashlib
+import hmac
+
+
+def compute_payment_signature(razorpay_order_id: str, razorpay_payment_id: str, key_secret: str) -> str:
+    """HMAC-SHA256 that Razorpay Checkout returns for "<order_id>|<payment_id>"."""
+    message = f"{razorpay_order_id}|{razorpay_payment_id}".encode()
+    return hmac.new(key_secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_payment_signature(
+    razorpay_order_id: str,
+    razorpay_payment_id: str,
+    razorpay_signature: str,
+    key_secret: str,
+) -> bool:
+    """Check a Checkout payment signature in constant time."""
+    if not key_secret or not razorpay_signature:
+        return False
+    expected = compute_payment_signature(razorpay_order_id, razorpay_payment_id, key_secret)
+    return _digests_equal(expected, razorpay_signature)
+
+
+def compute_webhook_signature(body: bytes, webhook_secret: str) -> str:
+    """HMAC-SHA256 that Razorpay sends in X-Razorpay-Signature for a webhook body."""
+    return hmac.new(webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_webhook_signature(body: bytes, signature: str, webhook_secret: str) -> bool:
+    """Check a webhook signature against the raw request body in constant time."""
+    if not webhook_secret or not signature:
+        return False
+    return _digests_equal(compute_webhook_signature(body, webhook_secret), signature)
+
+
+def _digests_equal(expected: str, received: str) -> bool:
+    # compare_digest raises TypeError for non-ASCII str, so compare the bytes instead
+    return hmac.compare_digest(expected.encode(), received.encode("utf-8", "replace"))
@@ -0,0 +1,14 @@
+def percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(samples) -> dict:
+    """avg / p95 / max in milliseconds for a window of durations given in seconds."""
+    return {
+        "avg_ms": round(1000 * sum(samples) / len(samples), 2) if samples else 0.0,
+        "p95_ms": round(1000 * percentile(samples, 0.95), 2),
+        "max_ms": round(1000 * max(samples), 2) if samples else 0.0,
+    }
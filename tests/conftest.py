@@ -0,0 +1,45 @@
+"""
+Shared fixtures for the in-process tests (the HTTP tests talk to BASE_URL instead).
+In-process tests get a throwaway database: a fresh one on the MongoDB at
+TEST_MONGODB_URI when set, otherwise an in-memory mongomock-motor database.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+TEST_MONGODB_URI = os.environ.get("TEST_MONGODB_URI", "")
+
+
+def _open_client():
+    if TEST_MONGODB_URI:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        return AsyncIOMotorClient(TEST_MONGODB_URI)
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()
+
+
+@pytest.fixture
+def run_with_db():
+    """Run scenario(db) on a fresh event loop against a throwaway database."""
+
+    def run(scenario):
+        async def main():
+            client = _open_client()
+            name = f"test_{uuid.uuid4().hex[:12]}"
+            try:
+                return await scenario(client[name])
+            finally:
+                await client.drop_database(name)
+                client.close()
+
+        return asyncio.run(main())
+
+    return run
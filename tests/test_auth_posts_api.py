@@ -70,6 +70,30 @@ class TestHealthCheck:
         assert data["status"] == "running"
 
 
+class TestMetrics:
+    """Admin runtime metrics endpoint tests"""
+    
+    def test_metrics_requires_admin(self, api_client, test_user_token):
+        """Test /api/metrics rejects anonymous and non-admin users"""
+        assert api_client.get(f"{BASE_URL}/api/metrics").status_code == 401
+        response = api_client.get(
+            f"{BASE_URL}/api/metrics",
+            headers={"Authorization": f"Bearer {test_user_token}"}
+        )
+        assert response.status_code == 403
+    
+    def test_metrics_as_admin(self, api_client, admin_token):
+        """Test /api/metrics reports the password hashing pool"""
+        response = api_client.get(
+            f"{BASE_URL}/api/metrics",
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["password_hashing"]["completed"] >= 1
+        assert "queued" in data["password_hashing"]
+
+
 class TestUserSignup:
     """User signup endpoint tests"""
     
@@ -162,6 +186,33 @@ class TestUserLogin:
         assert response.status_code == 401
 
 
+class TestTokenRefresh:
+    """Refresh token endpoint tests"""
+    
+    def test_refresh_rejects_access_token(self, api_client, test_user_token):
+        """Test /api/auth/refresh does not accept an access token"""
+        response = api_client.post(f"{BASE_URL}/api/auth/refresh", json={
+            "refresh_token": test_user_token
+        })
+        assert response.status_code == 401
+    
+    def test_refresh_issues_new_access_token(self, api_client):
+        """Test a refresh token from login can be exchanged (when claims mode is on)"""
+        response = api_client.post(f"{BASE_URL}/api/auth/login", json={
+            "email": ADMIN_EMAIL,
+            "password": ADMIN_PASSWORD
+        })
+        refresh_token = response.json().get("refresh_token")
+        if not refresh_token:
+            pytest.skip("Subscription claims are not enabled on this server")
+        
+        response = api_client.post(f"{BASE_URL}/api/auth/refresh", json={
+            "refresh_token": refresh_token
+        })
+        assert response.status_code == 200
+        assert response.json()["user"]["email"] == ADMIN_EMAIL
+
+
 class TestAdminLogin:
     """Admin login tests"""
     
@@ -250,6 +301,69 @@ class TestPostsListing:
         data = response.json()
         assert isinstance(data, list)
 
+    def test_listing_reflects_admin_writes(self, api_client, admin_token):
+        """Test GET /api/posts sees created and deleted posts immediately"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+
+        # Warm the listing before writing
+        api_client.get(f"{BASE_URL}/api/posts")
+
+        create_response = api_client.post(
+            f"{BASE_URL}/api/posts",
+            json={
+                "title": f"TEST_Listing_{uuid.uuid4().hex[:8]}",
+                "excerpt": "Listing cache test",
+                "content": "Listing cache test content"
+            },
+            headers=headers
+        )
+        assert create_response.status_code == 200
+        post_id = create_response.json()["id"]
+
+        listed_ids = [post["id"] for post in api_client.get(f"{BASE_URL}/api/posts").json()]
+        assert post_id in listed_ids
+
+        api_client.delete(f"{BASE_URL}/api/posts/{post_id}", headers=headers)
+
+        listed_ids = [post["id"] for post in api_client.get(f"{BASE_URL}/api/posts").json()]
+        assert post_id not in listed_ids
+
+    def test_cursor_pagination_matches_full_listing(self, api_client):
+        """Test walking GET /api/posts with limit/cursor returns every post once, in order"""
+        all_ids = [post["id"] for post in api_client.get(f"{BASE_URL}/api/posts").json()]
+
+        paged_ids = []
+        params = {"limit": 1}
+        while True:
+            response = api_client.get(f"{BASE_URL}/api/posts", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 1
+            paged_ids.extend(post["id"] for post in page)
+
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if not next_cursor:
+                break
+            params = {"limit": 1, "cursor": next_cursor}
+
+        assert paged_ids == all_ids
+
+    def test_fields_projection(self, api_client):
+        """Test GET /api/posts?fields= returns only the requested fields plus id"""
+        response = api_client.get(f"{BASE_URL}/api/posts", params={"fields": "title,slug,excerpt"})
+
+        assert response.status_code == 200
+        for post in response.json():
+            assert set(post.keys()) == {"id", "title", "slug", "excerpt"}
+
+    def test_invalid_cursor_and_fields(self, api_client):
+        """Test malformed cursor and unknown fields are rejected"""
+        response = api_client.get(f"{BASE_URL}/api/posts", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+        response = api_client.get(f"{BASE_URL}/api/posts", params={"fields": "password_hash"})
+        assert response.status_code == 400
+
 
 class TestSinglePost:
     """Single post endpoint tests"""
@@ -279,6 +393,97 @@ class TestSinglePost:
         assert response.status_code == 404
 
 
+class TestConditionalRequests:
+    """ETag / If-None-Match and Last-Modified tests for post endpoints"""
+    
+    def test_listing_not_modified(self, api_client):
+        """Test GET /api/posts returns 304 when the ETag still matches"""
+        response = api_client.get(f"{BASE_URL}/api/posts")
+        assert response.status_code == 200
+        etag = response.headers.get("ETag")
+        assert etag
+        
+        response = api_client.get(f"{BASE_URL}/api/posts", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers.get("ETag") == etag
+    
+    def test_post_not_modified(self, api_client):
+        """Test GET /api/posts/{id} honours If-None-Match"""
+        posts = api_client.get(f"{BASE_URL}/api/posts").json()
+        if len(posts) == 0:
+            pytest.skip("No posts available to test")
+        
+        url = f"{BASE_URL}/api/posts/{posts[0]['id']}"
+        response = api_client.get(url)
+        assert response.status_code == 200
+        etag = response.headers.get("ETag")
+        assert etag
+        
+        assert api_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+        assert api_client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+    
+    def test_if_modified_since_only_for_single_variant_posts(self, api_client, admin_token):
+        """Test Last-Modified is only used where every reader gets the same body"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        post_ids = {}
+        for is_premium in (False, True):
+            response = api_client.post(
+                f"{BASE_URL}/api/posts",
+                json={
+                    "title": f"TEST_LastModified_{uuid.uuid4().hex[:8]}",
+                    "excerpt": "Last-Modified test",
+                    "content": "A long essay. " * 50,
+                    "is_premium": is_premium
+                },
+                headers=headers
+            )
+            assert response.status_code == 200
+            post_ids[is_premium] = response.json()["id"]
+        
+        try:
+            free_url = f"{BASE_URL}/api/posts/{post_ids[False]}"
+            last_modified = api_client.get(free_url).headers.get("Last-Modified")
+            assert last_modified
+            assert api_client.get(free_url, headers={"If-Modified-Since": last_modified}).status_code == 304
+            
+            # A reader who subscribed after caching the preview must get the full body
+            premium_url = f"{BASE_URL}/api/posts/{post_ids[True]}"
+            preview = api_client.get(premium_url)
+            assert "Last-Modified" not in preview.headers
+            revalidated = api_client.get(
+                premium_url,
+                headers={**headers, "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+            )
+            assert revalidated.status_code == 200
+            assert len(revalidated.json()["content"]) > len(preview.json()["content"])
+        finally:
+            for post_id in post_ids.values():
+                api_client.delete(f"{BASE_URL}/api/posts/{post_id}", headers=headers)
+    
+    def test_variants_have_distinct_etags(self, api_client, admin_token):
+        """Test the preview and full variants of a premium post carry different ETags"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        create_response = api_client.post(
+            f"{BASE_URL}/api/posts",
+            json={
+                "title": f"TEST_ETag_{uuid.uuid4().hex[:8]}",
+                "excerpt": "ETag test",
+                "content": "A long premium essay. " * 50,
+                "is_premium": True
+            },
+            headers=headers
+        )
+        assert create_response.status_code == 200
+        post_id = create_response.json()["id"]
+        
+        preview = api_client.get(f"{BASE_URL}/api/posts/{post_id}")
+        full = api_client.get(f"{BASE_URL}/api/posts/{post_id}", headers=headers)
+        assert preview.headers["ETag"] != full.headers["ETag"]
+        
+        api_client.delete(f"{BASE_URL}/api/posts/{post_id}", headers=headers)
+
+
 class TestAdminCreatePost:
     """Admin create post tests"""
     
@@ -311,6 +516,24 @@ class TestAdminCreatePost:
         # Store for cleanup
         return data["id"]
     
+    def test_reserved_slug_is_suffixed(self, api_client, admin_token):
+        """Test a post titled "Search" does not take the /posts/search route"""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = api_client.post(
+            f"{BASE_URL}/api/posts",
+            json={"title": "Search", "excerpt": "Test", "content": "Test content", "is_premium": False},
+            headers=headers,
+        )
+        assert response.status_code == 200
+        post = response.json()
+        try:
+            assert post["slug"] != "search"
+            by_slug = api_client.get(f"{BASE_URL}/api/posts/{post['slug']}")
+            assert by_slug.status_code == 200
+            assert by_slug.json()["id"] == post["id"]
+        finally:
+            api_client.delete(f"{BASE_URL}/api/posts/{post['id']}", headers=headers)
+    
     def test_create_post_without_auth(self, api_client):
         """Test POST /api/posts without auth fails"""
         response = api_client.post(f"{BASE_URL}/api/posts", json={
@@ -0,0 +1,199 @@
+"""
+Tests for access and refresh tokens, run in-process with subscription claims enabled:
+- refresh tokens are single-use; replaying one revokes the user's sessions
+- a password reset revokes existing access and refresh tokens
+- claims tokens never outlive the subscription they describe
+- the verified-token cache is bounded and forgets a user when their account changes
+"""
+
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import FastAPI  # noqa: E402
+
+from routes import auth, password_reset  # noqa: E402
+from models.user import UserResponse  # noqa: E402
+from services.auth_cache import TokenCache, token_cache  # noqa: E402
+from utils.auth import decode_token, hash_password  # noqa: E402
+
+
+@pytest.fixture
+def auth_api(monkeypatch):
+    """The auth and password reset routers on an in-process app, in claims mode"""
+    monkeypatch.setattr(auth, "SUBSCRIPTION_CLAIMS_ENABLED", True)
+    monkeypatch.setattr(auth, "_db", None)
+    monkeypatch.setattr(password_reset, "_db", None)
+    token_cache.clear()
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api")
+    app.include_router(password_reset.router, prefix="/api")
+    yield app
+    token_cache.clear()
+
+
+def make_user(**fields):
+    user = {
+        "id": str(uuid.uuid4()),
+        "email": f"reader_{uuid.uuid4().hex[:8]}@example.com",
+        "name": "Reader",
+        "password_hash": hash_password("old-password"),
+        "is_admin": False,
+        "is_subscribed": False,
+    }
+    user.update(fields)
+    return user
+
+
+async def open_session(db, app, user):
+    """Insert the user and return (client, access token, refresh token) as login would."""
+    await auth.ensure_indexes(db)
+    await db.users.insert_one(dict(user))
+    auth.set_db(db)
+    password_reset.set_db(db)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    return client, auth.create_user_access_token(user), auth.create_user_refresh_token(user)
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestRefreshTokens:
+    """Refresh tokens rotate on use and are revoked with the user's sessions"""
+
+    def test_refresh_rotates_and_replay_revokes(self, auth_api, run_with_db):
+        """Test a refresh token works once; replaying it ends every session of the user"""
+        user = make_user()
+
+        async def scenario(db):
+            client, _, first = await open_session(db, auth_api, user)
+            async with client:
+                rotated = await client.post("/api/auth/refresh", json={"refresh_token": first})
+                second = rotated.json()["refresh_token"]
+                replayed = await client.post("/api/auth/refresh", json={"refresh_token": first})
+                after_replay = await client.post("/api/auth/refresh", json={"refresh_token": second})
+                access = await client.get("/api/auth/me", headers=bearer(rotated.json()["access_token"]))
+            return first, rotated, second, replayed, after_replay, access
+
+        first, rotated, second, replayed, after_replay, access = run_with_db(scenario)
+        assert rotated.status_code == 200
+        assert decode_token(second)["jti"] != decode_token(first)["jti"]
+        assert replayed.status_code == 401
+        # The rotated token and the access token issued with it were revoked too
+        assert after_replay.status_code == 401
+        assert access.status_code == 401
+
+    def test_password_reset_revokes_tokens(self, auth_api, run_with_db):
+        """Test tokens issued before a password reset stop working after it"""
+        user = make_user()
+
+        async def scenario(db):
+            client, access, refresh = await open_session(db, auth_api, user)
+            reset_token = uuid.uuid4().hex
+            await db.password_resets.insert_one({
+                "token": reset_token,
+                "user_id": user["id"],
+                "email": user["email"],
+                "used": False,
+                "expires_at": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
+            })
+            async with client:
+                before = await client.get("/api/auth/me", headers=bearer(access))
+                reset = await client.post(
+                    "/api/password-reset/confirm",
+                    json={"token": reset_token, "new_password": "new-password"},
+                )
+                me = await client.get("/api/auth/me", headers=bearer(access))
+                refreshed = await client.post("/api/auth/refresh", json={"refresh_token": refresh})
+            return before, reset, me, refreshed
+
+        before, reset, me, refreshed = run_with_db(scenario)
+        assert before.status_code == 200
+        assert reset.status_code == 200
+        assert me.status_code == 401
+        assert refreshed.status_code == 401
+
+
+class TestSubscriptionClaims:
+    """Claims tokens carry the subscription state for at most its remaining lifetime"""
+
+    def test_claims_token_expires_with_subscription(self, auth_api):
+        """Test a subscription ending within the token lifetime caps the token's expiry"""
+        ends_at = datetime.now(timezone.utc) + timedelta(minutes=5)
+        user = make_user(
+            is_subscribed=True,
+            subscription_type="monthly",
+            subscription_end_at=ends_at.isoformat(),
+        )
+        payload = decode_token(auth.create_user_access_token(user))
+        assert payload["is_subscribed"] is True
+        assert payload["subscription_end_at"] == ends_at.isoformat()
+        assert abs(payload["exp"] - ends_at.timestamp()) < 1
+
+    def test_claims_token_default_lifetime(self, auth_api):
+        """Test a subscription ending after the token lifetime leaves the default expiry"""
+        user = make_user(
+            is_subscribed=True,
+            subscription_type="yearly",
+            subscription_end_at=(datetime.now(timezone.utc) + timedelta(days=200)).isoformat(),
+        )
+        payload = decode_token(auth.create_user_access_token(user))
+        expected = datetime.now(timezone.utc) + timedelta(minutes=auth.CLAIMS_TOKEN_EXPIRE_MINUTES)
+        assert abs(payload["exp"] - expected.timestamp()) < 2
+
+
+def cached_user(user_id):
+    return UserResponse(id=user_id, email=f"{user_id}@example.com", name="Reader", is_admin=False, is_subscribed=False)
+
+
+class TestTokenCache:
+    """Verified tokens are cached per user and dropped when the user changes"""
+
+    def test_invalidate_user_drops_only_their_tokens(self):
+        """Test every token of the changed user is forgotten and other users keep theirs"""
+        cache = TokenCache(ttl_seconds=60, max_entries=10)
+        cache.put("a-phone", cached_user("a"))
+        cache.put("a-laptop", cached_user("a"))
+        cache.put("b-phone", cached_user("b"))
+        cache.invalidate_user("a")
+        assert cache.get("a-phone") is None and cache.get("a-laptop") is None
+        assert cache.get("b-phone").id == "b"
+
+    def test_entries_never_outlive_token_or_bound(self):
+        """Test an entry expires with its token and the oldest entries are evicted"""
+        cache = TokenCache(ttl_seconds=60, max_entries=2)
+        cache.put("expired", cached_user("a"), token_exp=time.time() - 1)
+        assert cache.get("expired") is None
+        for token in ("t1", "t2", "t3"):
+            cache.put(token, cached_user(token))
+        assert cache.get("t1") is None
+        assert cache.stats()["entries"] == 2
+
+    def test_subscribe_refreshes_cached_user(self, auth_api, run_with_db):
+        """Test a token cached before subscribing reports the subscription right after"""
+        user = make_user()
+
+        async def scenario(db):
+            client, access, _ = await open_session(db, auth_api, user)
+            async with client:
+                before = await client.get("/api/auth/me", headers=bearer(access))
+                subscribed = await client.post("/api/auth/subscribe", headers=bearer(access))
+                after = await client.get("/api/auth/me", headers=bearer(access))
+            return before.json(), subscribed.status_code, after.json()
+
+        before, subscribed, after = run_with_db(scenario)
+        assert before["is_subscribed"] is False
+        assert subscribed == 200
+        assert after["is_subscribed"] is True
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,90 @@
+"""
+Tests for the response compression middleware, run in-process on a bare ASGI app:
+- large bodies and stream chunks are compressed in a worker thread, small ones inline
+"""
+
+import asyncio
+import gzip
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from utils import compression  # noqa: E402
+from utils.compression import CompressionMiddleware  # noqa: E402
+
+THREAD_MIN_BYTES = 32 * 1024
+
+
+def text_app(chunks):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def serve(chunks):
+    """Return (decoded body, thread ids that ran compression) for one gzip request."""
+    app = CompressionMiddleware(text_app(chunks), minimum_size=16, thread_min_size=THREAD_MIN_BYTES)
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    async def main():
+        await app(scope, receive, send)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    return gzip.decompress(b"".join(body)), loop_thread
+
+
+@pytest.fixture
+def compress_threads(monkeypatch):
+    """Record the thread every whole-body compress() call runs on."""
+    threads = []
+    original = compression.compress
+
+    def recording(data, encoding, level):
+        threads.append(threading.get_ident())
+        return original(data, encoding, level)
+
+    monkeypatch.setattr(compression, "compress", recording)
+    return threads
+
+
+class TestCompressionMiddleware:
+    """Dynamic responses are compressed without blocking the event loop on large bodies"""
+
+    def test_large_body_compressed_off_loop(self, compress_threads):
+        """Test a body above the cutoff is compressed in a worker thread"""
+        data = b"a large text body " * (THREAD_MIN_BYTES // 8)
+        body, loop_thread = serve([data])
+        assert body == data
+        assert compress_threads and compress_threads[0] != loop_thread
+
+    def test_small_body_compressed_inline(self, compress_threads):
+        """Test a body below the cutoff skips the thread hand-off"""
+        data = b"a small text body " * 64
+        body, loop_thread = serve([data])
+        assert body == data
+        assert compress_threads == [loop_thread]
+
+    def test_streamed_chunks_decode(self):
+        """Test a stream mixing large and small chunks still decodes to the original"""
+        chunks = [b"x" * THREAD_MIN_BYTES, b"small tail", b"y" * (THREAD_MIN_BYTES * 2), b""]
+        body, _ = serve(chunks)
+        assert body == b"".join(chunks)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,83 @@
+"""
+Tests for the image derivative pipeline, run in-process against local storage:
+- a worker pool broken by a killed worker is replaced and the upload still processed
+- the in-memory manifest cache stays bounded and falls back to storage
+"""
+
+import asyncio
+import os
+import signal
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from PIL import Image  # noqa: E402
+
+from services.image_pipeline import ImagePipeline  # noqa: E402
+from services.storage import LocalStorage  # noqa: E402
+
+
+def write_jpeg(path: Path, color: str) -> None:
+    buffer = BytesIO()
+    Image.new("RGB", (400, 300), color).save(buffer, format="JPEG")
+    path.write_bytes(buffer.getvalue())
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    storage = LocalStorage(str(tmp_path / "uploads"))
+    work_dir = tmp_path / "staging"
+    work_dir.mkdir()
+    pipeline = ImagePipeline(storage, str(work_dir), widths=[320, 640], workers=1, manifest_cache_entries=2)
+    yield pipeline
+    pipeline.shutdown()
+
+
+class TestImagePipeline:
+    """Derivatives are rendered on a process pool that survives worker crashes"""
+
+    def test_broken_pool_is_replaced(self, pipeline, tmp_path):
+        """Test an upload after a worker was killed gets a fresh pool instead of BrokenProcessPool"""
+        first, second = tmp_path / "first.jpg", tmp_path / "second.jpg"
+        write_jpeg(first, "red")
+        write_jpeg(second, "blue")
+
+        async def scenario():
+            assert await pipeline.process("a" * 64 + ".jpg", str(first)) is not None
+            broken = pipeline._executor
+            for process in list(broken._processes.values()):
+                os.kill(process.pid, signal.SIGKILL)
+            manifest = await pipeline.process("b" * 64 + ".jpg", str(second))
+            return broken, manifest
+
+        broken, manifest = asyncio.run(scenario())
+        assert manifest is not None
+        assert manifest["width"] == 400
+        assert pipeline._executor is not broken
+
+    def test_manifest_cache_is_bounded(self, pipeline, tmp_path):
+        """Test only the newest manifests stay in memory and evicted ones are read back"""
+        source = tmp_path / "source.jpg"
+        write_jpeg(source, "green")
+        stems = [char * 64 for char in "abc"]
+
+        async def scenario():
+            for stem in stems:
+                await pipeline.process(f"{stem}.jpg", str(source))
+            cached = list(pipeline._manifests)
+            return cached, await pipeline.manifest(stems[0])
+
+        cached, evicted = asyncio.run(scenario())
+        assert cached == stems[1:]
+        assert evicted is not None and evicted["stem"] == stems[0]
+        assert len(pipeline._manifests) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,75 @@
+"""
+Tests for the MongoDB job queue (webhook events and the notification outbox):
+- finished jobs expire through a TTL index on finished_at
+- a worker whose lease ran out cannot overwrite the job's new owner
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from services.job_queue import MongoJobQueue
+
+
+async def noop(db, payload):
+    pass
+
+
+class TestMongoJobQueue:
+    """Jobs are enqueued once, claimed under a lease and finished by their owner"""
+
+    def test_finished_jobs_expire(self, run_with_db):
+        """Test done jobs carry a BSON date covered by the retention TTL index"""
+        queue = MongoJobQueue("jobs", noop, retention_seconds=3600)
+
+        async def scenario(db):
+            await queue.ensure_indexes(db)
+            await queue.enqueue(db, "job-1", {"n": 1})
+            await queue._run_job(db, await queue._claim(db))
+            return await db.jobs.index_information(), await db.jobs.find_one({"id": "job-1"})
+
+        indexes, job = run_with_db(scenario)
+        ttl = [index for index in indexes.values() if index["key"] == [("finished_at", 1)]]
+        assert ttl and ttl[0]["expireAfterSeconds"] == 3600
+        assert job["status"] == "done"
+        assert isinstance(job["finished_at"], datetime)
+
+    def test_duplicate_ids_are_dropped(self, run_with_db):
+        """Test a replayed job id is not queued twice"""
+        queue = MongoJobQueue("jobs", noop)
+
+        async def scenario(db):
+            await queue.ensure_indexes(db)
+            first = await queue.enqueue(db, "event-1", {"n": 1})
+            second = await queue.enqueue(db, "event-1", {"n": 1})
+            return first, second, await db.jobs.count_documents({})
+
+        assert run_with_db(scenario) == (True, False, 1)
+
+    def test_expired_lease_cannot_complete(self, run_with_db):
+        """Test a worker that outlived its lease leaves the re-claimed job alone"""
+        queue = MongoJobQueue("jobs", noop, lease_seconds=0)
+
+        async def scenario(db):
+            await queue.ensure_indexes(db)
+            await queue.enqueue(db, "job-1", {"n": 1})
+            stale = await queue._claim(db)
+            await asyncio.sleep(0.01)
+            current = await queue._claim(db)
+            await queue._run_job(db, stale)
+            after_stale = await db.jobs.find_one({"id": "job-1"})
+            await queue._run_job(db, current)
+            return current, after_stale, await db.jobs.find_one({"id": "job-1"})
+
+        current, after_stale, finished = run_with_db(scenario)
+        assert current["attempts"] == 2
+        assert after_stale["status"] == "processing"
+        assert after_stale["locked_until"] == current["locked_until"]
+        assert queue.leases_lost == 1
+        assert finished["status"] == "done"
+        assert queue.succeeded == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,76 @@
+"""
+Tests for the API's JSON encoding, run in-process:
+- with orjson installed, responses and dumps() are rendered by orjson
+- without it, the stdlib fallback produces the same bytes
+"""
+
+import asyncio
+import importlib
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from utils import json_encoding  # noqa: E402
+
+VALUE = {"title": "Café ✓ \"quoted\"", "count": 3, "ratio": 0.5, "premium": True, "tags": ["a", None]}
+
+
+def stdlib_compact(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+@pytest.fixture
+def without_orjson(monkeypatch):
+    """json_encoding re-imported as if orjson were not installed"""
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    yield importlib.reload(json_encoding)
+    monkeypatch.undo()
+    importlib.reload(json_encoding)
+
+
+class TestJsonEncoding:
+    """API bodies are compact UTF-8 JSON whichever encoder renders them"""
+
+    def test_orjson_renders_responses(self):
+        """Test the default response class and dumps() use orjson when it is installed"""
+        orjson = pytest.importorskip("orjson")
+        from fastapi.responses import ORJSONResponse
+
+        assert json_encoding.APIJSONResponse is ORJSONResponse
+        assert json_encoding.dumps(VALUE) == orjson.dumps(VALUE) == stdlib_compact(VALUE)
+
+    def test_fallback_matches_orjson_output(self, without_orjson):
+        """Test the stdlib fallback is used without orjson and yields the same bytes"""
+        assert without_orjson.APIJSONResponse is JSONResponse
+        assert without_orjson.dumps(VALUE) == stdlib_compact(VALUE)
+
+    def test_endpoint_body(self):
+        """Test a route on the default response class returns compact JSON with encoded datetimes"""
+        app = FastAPI(default_response_class=json_encoding.APIJSONResponse)
+        when = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+        @app.get("/item")
+        async def item():
+            return dict(VALUE, updated_at=when)
+
+        async def fetch():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get("/item")
+
+        response = asyncio.run(fetch())
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == stdlib_compact(dict(VALUE, updated_at=when.isoformat()))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -2,15 +2,121 @@
 Test suite for new features:
 - Password Reset Flow (with Resend - mocked/dev mode)
 - Razorpay Payment Config (not configured - returns configured=false)
+- Razorpay fulfillment, run in-process against the fake gateway (see payments_api)
+- Subscription expiry runs, in-process with notifications stubbed (see expiry_job)
 """
 
+import asyncio
+import hashlib
+import json
 import pytest
 import requests
 import os
 import uuid
 
+from utils.signatures import compute_webhook_signature
+
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://editorial-hub-9.preview.emergentagent.com').rstrip('/')
 
+WEBHOOK_SECRET = "whsec_test"
+
+
+@pytest.fixture
+def payments_api(monkeypatch):
+    """
+    The payments router on an in-process app with the fake gateway and a webhook
+    secret, for the fulfillment flows the live server (not configured) cannot run
+    """
+    from fastapi import FastAPI
+    from routes import payments
+    from services.payment_gateway import FakePaymentGateway
+
+    monkeypatch.setattr(payments, "payment_gateway", FakePaymentGateway(latency_seconds=0))
+    monkeypatch.setattr(payments, "RAZORPAY_CONFIGURED", True)
+    monkeypatch.setattr(payments, "RAZORPAY_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    monkeypatch.setattr(payments, "FULFILLMENT_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(payments, "_db", None)
+    app = FastAPI()
+    app.include_router(payments.router, prefix="/api")
+    return payments, app
+
+
+def asgi_client(app):
+    import httpx
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def create_signup_order(api, email, mobile=None):
+    response = await api.post(
+        "/api/payments/create-pending-signup-order",
+        json={"plan_id": "yearly", "name": "Buyer", "email": email, "password": "secret123", "mobile": mobile},
+    )
+    assert response.status_code == 200
+    return response.json()["order_id"]
+
+
+def verify_body(payments, order_id, payment_id):
+    return {
+        "razorpay_order_id": order_id,
+        "razorpay_payment_id": payment_id,
+        "razorpay_signature": payments.payment_gateway.sign_payment(order_id, payment_id),
+    }
+
+
+# Longer than the 500-character premium preview
+PREVIEW_FILLER = "A quiet morning walk before the day begins. " * 15
+
+
+def search_post(post_id, content, premium=True):
+    return {
+        "id": post_id,
+        "title": f"Essay {post_id}",
+        "slug": f"essay-{post_id}",
+        "excerpt": "An essay.",
+        "content": content,
+        "is_premium": premium,
+        "created_at": "2024-01-01T00:00:00+00:00",
+        "updated_at": "2024-01-01T00:00:00+00:00",
+    }
+
+
+@pytest.fixture
+def expiry_job(monkeypatch):
+    """The expiry job with notifications recorded instead of sent; names starting "fail" raise"""
+    from routes import subscription_expiry
+
+    notified = []
+
+    async def send_notification(name, email, mobile, subscription_type):
+        notified.append(email)
+        if name.startswith("fail"):
+            raise RuntimeError(f"provider rejected {email}")
+        return {"email_sent": True, "sms_sent": bool(mobile)}
+
+    monkeypatch.setattr(subscription_expiry, "send_subscription_expiry_notification", send_notification)
+    monkeypatch.setattr(subscription_expiry, "_db", None)
+    return subscription_expiry, notified
+
+
+def expiry_user(user_id, end_at, subscription_type="monthly", name="Reader", mobile=None):
+    return {
+        "id": user_id,
+        "name": name,
+        "email": f"{user_id}@example.com",
+        "mobile": mobile,
+        "is_subscribed": True,
+        "subscription_type": subscription_type,
+        "subscription_end_at": end_at,
+    }
+
+
+def captured_event(order_id, payment_id):
+    return {
+        "event": "payment.captured",
+        "payload": {"payment": {"entity": {"id": payment_id, "order_id": order_id}}},
+    }
+
 
 class TestPasswordResetFlow:
     """Password reset endpoint tests - Resend not configured, returns dev_token"""
@@ -251,6 +357,251 @@ class TestRazorpayPayments:
         response = requests.get(f"{BASE_URL}/api/payments/orders")
         assert response.status_code == 401
 
+    def test_concurrent_verify_and_webhooks_fulfill_once(self, payments_api, run_with_db, monkeypatch):
+        """Test racing /verify calls and captured webhooks activate and notify exactly once"""
+        payments, app = payments_api
+        email = f"buyer_{uuid.uuid4().hex[:8]}@example.com"
+        enqueue = payments._enqueue_purchase_notification
+
+        async def slow_enqueue(db, order, user_doc):
+            # Hold the claim open so every other caller arrives while it is taken
+            await asyncio.sleep(0.1)
+            await enqueue(db, order, user_doc)
+
+        monkeypatch.setattr(payments, "_enqueue_purchase_notification", slow_enqueue)
+
+        async def scenario(db):
+            payments.set_db(db)
+            async with asgi_client(app) as api:
+                order_id = await create_signup_order(api, email, mobile="+919800000000")
+                body = verify_body(payments, order_id, "pay_race")
+                results = await asyncio.gather(
+                    *[api.post("/api/payments/verify", json=body) for _ in range(4)],
+                    *[payments.process_webhook_event(db, captured_event(order_id, "pay_race")) for _ in range(3)],
+                )
+            outbox = await db.notification_outbox.find({}, {"_id": 0}).to_list(length=None)
+            return (
+                order_id,
+                results[:4],
+                await db.users.find({"email": email}, {"_id": 0}).to_list(length=None),
+                await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0}),
+                outbox,
+            )
+
+        order_id, verified, users, order, outbox = run_with_db(scenario)
+        assert [response.status_code for response in verified] == [200] * 4
+        assert len(users) == 1
+        assert {response.json()["user"]["id"] for response in verified} == {users[0]["id"]}
+        # Every fulfillment stamps a fresh end date, so one value means one activation
+        assert {response.json()["user"]["subscription_end_at"] for response in verified} == {
+            users[0]["subscription_end_at"]
+        }
+        assert order["status"] == "paid" and order["user_id"] == users[0]["id"]
+        assert "fulfillment_lease_until" not in order and "pending_user_data" not in order
+        assert sorted(job["id"] for job in outbox) == [
+            f"purchase:{order_id}:email",
+            f"purchase:{order_id}:sms",
+        ]
+
+    def test_fake_gateway_orders_are_bounded(self):
+        """Test the fake gateway keeps only its newest orders and forgets them on shutdown"""
+        from services.payment_gateway import FakePaymentGateway
+
+        gateway = FakePaymentGateway(latency_seconds=0, max_orders=2)
+
+        async def scenario():
+            return [await gateway.create_order({"amount": 100, "currency": "INR"}) for _ in range(3)]
+
+        created = asyncio.run(scenario())
+        assert list(gateway.orders) == [order["id"] for order in created[1:]]
+        gateway.shutdown()
+        assert not gateway.orders
+
+    def test_failed_fulfillment_releases_claim(self, payments_api, run_with_db, monkeypatch):
+        """Test an error during fulfillment hands the order back so a retry completes it"""
+        payments, app = payments_api
+        email = f"buyer_{uuid.uuid4().hex[:8]}@example.com"
+        enqueue = payments._enqueue_purchase_notification
+        calls = []
+
+        async def flaky_enqueue(db, order, user_doc):
+            calls.append(order["razorpay_order_id"])
+            if len(calls) == 1:
+                raise RuntimeError("outbox unavailable")
+            await enqueue(db, order, user_doc)
+
+        monkeypatch.setattr(payments, "_enqueue_purchase_notification", flaky_enqueue)
+
+        async def scenario(db):
+            payments.set_db(db)
+            async with asgi_client(app) as api:
+                order_id = await create_signup_order(api, email)
+                body = verify_body(payments, order_id, "pay_retry")
+                failed = await api.post("/api/payments/verify", json=body)
+                released = await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0})
+                retried = await api.post("/api/payments/verify", json=body)
+            return (
+                failed,
+                released,
+                retried,
+                await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0}),
+                await db.users.count_documents({"email": email}),
+                await db.notification_outbox.count_documents({}),
+            )
+
+        failed, released, retried, order, user_count, outbox_count = run_with_db(scenario)
+        assert failed.status_code == 500
+        assert released["status"] == "pending_signup"
+        assert "fulfillment_lease_until" not in released
+        assert released["pending_user_data"]["email"] == email
+        assert retried.status_code == 200
+        assert order["status"] == "paid"
+        assert user_count == 1
+        assert outbox_count == 1
+
+    def test_stalled_fulfillment_resumes_after_lease(self, payments_api, run_with_db, monkeypatch):
+        """Test an order left fulfilling after a crash is taken over once its lease runs out"""
+        payments, app = payments_api
+        monkeypatch.setattr(payments, "FULFILLMENT_WAIT_SECONDS", 0.05)
+        email = f"buyer_{uuid.uuid4().hex[:8]}@example.com"
+        mark_paid = payments._mark_order_paid
+
+        async def hang(*args, **kwargs):
+            await asyncio.Event().wait()
+
+        async def scenario(db):
+            from services.notification_outbox import notification_outbox
+
+            payments.set_db(db)
+            # The takeover re-enqueues; the outbox's unique ids drop the repeat
+            await notification_outbox.ensure_indexes(db)
+            async with asgi_client(app) as api:
+                order_id = await create_signup_order(api, email, mobile="+919800000000")
+                # The first worker stops after writing the outbox, before marking the order paid
+                monkeypatch.setattr(payments, "_mark_order_paid", hang)
+                worker = asyncio.create_task(
+                    payments.process_webhook_event(db, captured_event(order_id, "pay_stall"))
+                )
+                while await db.notification_outbox.count_documents({}) < 2:
+                    await asyncio.sleep(0.01)
+                worker.cancel()
+                await asyncio.gather(worker, return_exceptions=True)
+                monkeypatch.setattr(payments, "_mark_order_paid", mark_paid)
+                stalled = await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0})
+
+                body = verify_body(payments, order_id, "pay_stall")
+                within_lease = await api.post("/api/payments/verify", json=body)
+                await db.orders.update_one(
+                    {"razorpay_order_id": order_id},
+                    {"$set": {"fulfillment_lease_until": "2000-01-01T00:00:00+00:00"}},
+                )
+                after_lease = await api.post("/api/payments/verify", json=body)
+            return (
+                order_id,
+                stalled,
+                within_lease,
+                after_lease,
+                await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0}),
+                await db.users.count_documents({"email": email}),
+                await db.notification_outbox.find({}, {"_id": 0}).to_list(length=None),
+            )
+
+        order_id, stalled, within_lease, after_lease, order, user_count, outbox = run_with_db(scenario)
+        assert stalled["status"] == "fulfilling"
+        assert within_lease.status_code == 409
+        assert after_lease.status_code == 200
+        assert order["status"] == "paid" and "fulfillment_lease_until" not in order
+        assert user_count == 1
+        # Written before the crash and again by the takeover, but delivered once per channel
+        assert sorted(job["id"] for job in outbox) == [
+            f"purchase:{order_id}:email",
+            f"purchase:{order_id}:sms",
+        ]
+
+    def test_webhook_acknowledged_before_processing(self, payments_api, run_with_db):
+        """Test a verified webhook is queued and answered with 200 before the order changes"""
+        payments, app = payments_api
+
+        async def scenario(db):
+            payments.set_db(db)
+            async with asgi_client(app) as api:
+                order_id = await create_signup_order(api, f"buyer_{uuid.uuid4().hex[:8]}@example.com")
+                body = json.dumps(captured_event(order_id, "pay_hook")).encode()
+                response = await api.post(
+                    "/api/payments/webhook",
+                    content=body,
+                    headers={
+                        "X-Razorpay-Signature": compute_webhook_signature(body, WEBHOOK_SECRET),
+                        "X-Razorpay-Event-Id": f"evt_{uuid.uuid4().hex[:12]}",
+                    },
+                )
+            queued = await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0})
+            jobs = await db.webhook_events.find({}, {"_id": 0}).to_list(length=None)
+            # What a webhook worker does with the queued event
+            await payments.webhook_queue._run_job(db, await payments.webhook_queue._claim(db))
+            applied = await db.orders.find_one({"razorpay_order_id": order_id}, {"_id": 0})
+            return response, queued, jobs, applied
+
+        response, queued, jobs, applied = run_with_db(scenario)
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+        assert queued["status"] == "pending_signup"
+        assert len(jobs) == 1 and jobs[0]["status"] == "pending" and jobs[0]["event"] == "payment.captured"
+        assert applied["status"] == "paid" and applied["razorpay_payment_id"] == "pay_hook"
+
+    def test_webhook_redeliveries_are_deduplicated(self, payments_api, run_with_db):
+        """Test the same event id, or the same body without one, is queued only once"""
+        payments, app = payments_api
+        with_id = json.dumps(captured_event("order_dedupe1", "pay_dedupe1")).encode()
+        without_id = json.dumps(captured_event("order_dedupe2", "pay_dedupe2")).encode()
+
+        async def scenario(db):
+            payments.set_db(db)
+            await payments.webhook_queue.ensure_indexes(db)
+            statuses = []
+            async with asgi_client(app) as api:
+                for body, event_id in ((with_id, "evt_repeat"), (without_id, None)):
+                    headers = {"X-Razorpay-Signature": compute_webhook_signature(body, WEBHOOK_SECRET)}
+                    if event_id:
+                        headers["X-Razorpay-Event-Id"] = event_id
+                    for _ in range(2):
+                        response = await api.post("/api/payments/webhook", content=body, headers=headers)
+                        statuses.append(response.status_code)
+            return statuses, await db.webhook_events.find({}, {"_id": 0, "id": 1}).to_list(length=None)
+
+        statuses, jobs = run_with_db(scenario)
+        # Replays are still acknowledged so Razorpay stops retrying
+        assert statuses == [200] * 4
+        assert sorted(job["id"] for job in jobs) == sorted(
+            ["evt_repeat", hashlib.sha256(without_id).hexdigest()]
+        )
+
+    def test_webhook_rejects_bad_signatures(self, payments_api, run_with_db):
+        """Test missing or forged signatures are refused and nothing is queued"""
+        payments, app = payments_api
+        body = json.dumps(captured_event("order_forged", "pay_forged")).encode()
+        forged = compute_webhook_signature(body, "not-the-secret")
+
+        async def scenario(db):
+            payments.set_db(db)
+            async with asgi_client(app) as api:
+                missing = await api.post("/api/payments/webhook", content=body)
+                invalid = await api.post(
+                    "/api/payments/webhook", content=body, headers={"X-Razorpay-Signature": forged}
+                )
+                tampered = await api.post(
+                    "/api/payments/webhook",
+                    content=body.replace(b"pay_forged", b"pay_changed"),
+                    headers={"X-Razorpay-Signature": compute_webhook_signature(body, WEBHOOK_SECRET)},
+                )
+            return missing, invalid, tampered, await db.webhook_events.count_documents({})
+
+        missing, invalid, tampered, queued = run_with_db(scenario)
+        assert missing.status_code == 400
+        assert invalid.status_code == 401
+        assert tampered.status_code == 401
+        assert queued == 0
+
 
 class TestExistingEndpoints:
     """Verify existing endpoints still work after new features added"""
@@ -283,5 +634,318 @@ class TestExistingEndpoints:
         assert isinstance(response.json(), list)
 
 
+
+class TestImageUpload:
+    """Image upload is streamed to disk and typed by its magic bytes"""
+
+    PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+    def test_upload_png_returns_url(self):
+        """Test a PNG upload is stored with a .png name and served back"""
+        response = requests.post(
+            f"{BASE_URL}/api/upload-image",
+            files={"image": ("photo.jpeg", self.PNG_BYTES, "image/jpeg")},
+        )
+        assert response.status_code == 200
+        url = response.json()["url"]
+        assert url.startswith("/uploads/") and url.endswith(".png")
+
+        served = requests.get(f"{BASE_URL}{url}")
+        assert served.status_code == 200
+        assert served.content == self.PNG_BYTES
+        assert "immutable" in served.headers.get("cache-control", "")
+
+        revalidated = requests.get(f"{BASE_URL}{url}", headers={"If-None-Match": served.headers["etag"]})
+        assert revalidated.status_code == 304
+
+    def test_identical_uploads_share_one_file(self):
+        """Test files are named by content hash, so re-uploading the same bytes dedupes"""
+        first = requests.post(
+            f"{BASE_URL}/api/upload-image",
+            files={"image": ("one.png", self.PNG_BYTES, "image/png")},
+        )
+        second = requests.post(
+            f"{BASE_URL}/api/upload-image",
+            files={"image": ("two.png", self.PNG_BYTES, "image/png")},
+        )
+        assert first.status_code == 200 and second.status_code == 200
+        assert first.json()["url"] == second.json()["url"]
+
+    def test_upload_jpeg_generates_derivatives(self):
+        """Test a real JPEG gets a srcset and /api/images negotiates the format from Accept"""
+        Image = pytest.importorskip("PIL.Image")
+        import io
+
+        # A fresh colour per run, so the pipeline really renders instead of deduping
+        seed = uuid.uuid4().bytes
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 300), tuple(seed[:3])).save(buffer, format="JPEG")
+
+        response = requests.post(
+            f"{BASE_URL}/api/upload-image",
+            files={"image": ("photo.jpg", buffer.getvalue(), "image/jpeg")},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["url"].startswith("/api/images/")
+        assert data["original_url"].endswith(".jpg")
+        assert (data["width"], data["height"]) == (400, 300)
+        assert "320w" in data["srcset"]["image/webp"] and "400w" in data["srcset"]["image/webp"]
+        assert "image/jpeg" in data["srcset"]
+
+        image_url = f"{BASE_URL}{data['url']}"
+        webp = requests.get(image_url, headers={"Accept": "image/webp,image/*"})
+        assert webp.status_code == 200
+        assert webp.headers["content-type"] == "image/webp"
+        assert "Accept" in webp.headers.get("vary", "")
+
+        fallback = requests.get(image_url, headers={"Accept": "*/*"})
+        assert fallback.headers["content-type"] == "image/jpeg"
+
+        small = requests.get(image_url, params={"w": 300}, headers={"Accept": "*/*"})
+        assert Image.open(io.BytesIO(small.content)).width == 320
+
+        if "image/avif" in data["srcset"]:
+            avif = requests.get(image_url, headers={"Accept": "image/avif,image/webp"})
+            assert avif.headers["content-type"] == "image/avif"
+
+    def test_upload_rejects_non_image(self):
+        """Test a file that is not an image is rejected regardless of its name"""
+        response = requests.post(
+            f"{BASE_URL}/api/upload-image",
+            files={"image": ("photo.png", b"<html>not an image</html>", "image/png")},
+        )
+        assert response.status_code == 400
+
+
+
+class TestResponseCompression:
+    """Post bodies and other JSON responses are compressed for clients that accept it"""
+
+    def test_post_listing_gzip(self):
+        """Test the post listing is gzipped and varies on Accept-Encoding"""
+        response = requests.get(f"{BASE_URL}/api/posts", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        vary = response.headers.get("vary", "")
+        assert "Accept-Encoding" in vary and "Authorization" in vary
+        assert isinstance(response.json(), list)
+
+    def test_post_listing_identity(self):
+        """Test clients that do not accept compression get the plain body"""
+        response = requests.get(f"{BASE_URL}/api/posts", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers.get("vary", "")
+
+    def test_compressed_body_is_reused(self):
+        """Test repeat requests get identical compressed bytes and can revalidate"""
+        headers = {"Accept-Encoding": "br, gzip"}
+        first = requests.get(f"{BASE_URL}/api/posts", headers=headers, stream=True)
+        second = requests.get(f"{BASE_URL}/api/posts", headers=headers, stream=True)
+        assert first.headers.get("content-encoding") in ("br", "gzip")
+        assert first.raw.read() == second.raw.read()
+        assert first.headers["etag"] == second.headers["etag"]
+
+        revalidated = requests.get(
+            f"{BASE_URL}/api/posts",
+            headers={**headers, "If-None-Match": first.headers["etag"]},
+        )
+        assert revalidated.status_code == 304
+
+    def test_each_coding_has_its_own_etag(self):
+        """Test gzip and identity bodies carry different strong ETags and both revalidate"""
+        gzipped = requests.get(f"{BASE_URL}/api/posts", headers={"Accept-Encoding": "gzip"})
+        identity = requests.get(f"{BASE_URL}/api/posts", headers={"Accept-Encoding": "identity"})
+        assert gzipped.headers["etag"] != identity.headers["etag"]
+        assert gzipped.headers["etag"].endswith('-gzip"')
+
+        for response, coding in ((gzipped, "gzip"), (identity, "identity")):
+            revalidated = requests.get(
+                f"{BASE_URL}/api/posts",
+                headers={"Accept-Encoding": coding, "If-None-Match": response.headers["etag"]},
+            )
+            assert revalidated.status_code == 304
+            assert revalidated.headers["etag"] == response.headers["etag"]
+
+    def test_small_responses_not_compressed(self):
+        """Test bodies under the size threshold are sent as-is"""
+        response = requests.get(f"{BASE_URL}/api/health", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+    def test_other_json_compressed_by_middleware(self):
+        """Test large JSON responses outside the post routes are compressed too"""
+        response = requests.get(f"{BASE_URL}/openapi.json", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        assert "paths" in response.json()
+
+
+
+class TestSubscriptionExpiry:
+    """The expiry job unsubscribes lapsed users once and reports what it did"""
+
+    def test_report_counts_and_failures(self, expiry_job, run_with_db, monkeypatch):
+        """Test the run report: counts, a capped failure list and the run id on expired users"""
+        subscription_expiry, notified = expiry_job
+        monkeypatch.setattr(subscription_expiry, "EXPIRY_MAX_REPORTED_FAILURES", 1)
+        past, future = "2020-01-01T00:00:00+00:00", "2999-01-01T00:00:00+00:00"
+        users = [
+            expiry_user("lapsed", past, mobile="+15550100"),
+            expiry_user("fail-1", past, name="fail one"),
+            expiry_user("fail-2", past, name="fail two"),
+            expiry_user("active", future),
+            expiry_user("lifetime", past, subscription_type="lifetime"),
+        ]
+
+        async def scenario(db):
+            await db.users.insert_many([dict(user) for user in users])
+            subscription_expiry.set_db(db)
+            report = await subscription_expiry.check_and_notify_expired_subscriptions()
+            states = {
+                user["id"]: user
+                for user in await db.users.find({}, {"_id": 0}).to_list(length=None)
+            }
+            return report, states
+
+        report, states = run_with_db(scenario)
+        assert set(report) == {
+            "checked_at", "run_id", "expired_count", "emails_sent", "sms_sent", "failed_count", "failures"
+        }
+        assert report["expired_count"] == 3
+        assert (report["emails_sent"], report["sms_sent"]) == (1, 1)
+        assert report["failed_count"] == 2
+        assert len(report["failures"]) == 1
+        assert report["failures"][0]["user_id"] in {"fail-1", "fail-2"}
+        assert "provider rejected" in report["failures"][0]["error"]
+        assert sorted(notified) == ["fail-1@example.com", "fail-2@example.com", "lapsed@example.com"]
+        expired = {user_id for user_id, user in states.items() if not user["is_subscribed"]}
+        assert expired == {"lapsed", "fail-1", "fail-2"}
+        assert {states[user_id]["expired_by_run"] for user_id in expired} == {report["run_id"]}
+
+    def test_only_users_expired_by_this_run_are_notified(self, expiry_job, run_with_db):
+        """Test a renewed user and users another run already expired are left alone"""
+        from datetime import datetime, timezone
+
+        subscription_expiry, notified = expiry_job
+        current_time = datetime.now(timezone.utc)
+        past = "2020-01-01T00:00:00+00:00"
+        stale = [expiry_user("lapsed", past), expiry_user("renewed", past)]
+
+        async def scenario(db):
+            await db.users.insert_many([dict(user) for user in stale])
+            # Renewed after the job's cursor read it
+            await db.users.update_one({"id": "renewed"}, {"$set": {"subscription_end_at": "2999-01-01T00:00:00+00:00"}})
+            semaphore = asyncio.Semaphore(10)
+            first, overlapping = subscription_expiry.ExpiryReport(), subscription_expiry.ExpiryReport()
+            await subscription_expiry._expire_batch(db, stale, current_time, semaphore, first)
+            # A second run in the same instant (cron plus a manual trigger) with the same stale batch
+            await subscription_expiry._expire_batch(db, stale, current_time, semaphore, overlapping)
+            return first, overlapping, await db.users.find_one({"id": "renewed"}, {"_id": 0})
+
+        first, overlapping, renewed = run_with_db(scenario)
+        assert first.expired_count == 1
+        assert overlapping.expired_count == 0
+        assert notified == ["lapsed@example.com"]
+        assert renewed["is_subscribed"] is True
+
+
+class TestPostSearch:
+    """Full-text search over posts with highlighted snippets"""
+
+    def test_search_finds_seeded_post(self):
+        """Test a title word finds the seeded post with a highlighted snippet"""
+        response = requests.get(f"{BASE_URL}/api/posts/search", params={"q": "experiments"})
+        assert response.status_code == 200
+        results = response.json()
+        assert any(r["id"] == "faith-experiments-intro" for r in results)
+        hit = next(r for r in results if r["id"] == "faith-experiments-intro")
+        assert "<mark>" in hit["snippet"]
+        assert "content" not in hit
+
+    def test_search_not_treated_as_post_id(self):
+        """Test /posts/search is routed to search, not looked up as a post slug"""
+        response = requests.get(f"{BASE_URL}/api/posts/search", params={"q": "zzqxnonexistentword"})
+        assert response.status_code == 200
+        assert response.json() == []
+
+    def test_search_requires_query(self):
+        """Test an empty query is rejected"""
+        response = requests.get(f"{BASE_URL}/api/posts/search", params={"q": ""})
+        assert response.status_code == 422
+
+    def test_gated_text_not_searchable_without_subscription(self):
+        """Test non-subscribers cannot find premium posts by text beyond the preview"""
+        # "revision" only appears past the preview in the seeded premium post
+        response = requests.get(f"{BASE_URL}/api/posts/search", params={"q": "revision"})
+        assert response.status_code == 200
+        assert "faith-experiments-intro" not in [result["id"] for result in response.json()]
+
+        login_response = requests.post(
+            f"{BASE_URL}/api/auth/login",
+            json={"email": "admin@faithbyexperiments.com", "password": "admin123"}
+        )
+        token = login_response.json()["access_token"]
+        response = requests.get(
+            f"{BASE_URL}/api/posts/search",
+            params={"q": "revision"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        results = {result["id"]: result for result in response.json()}
+        assert "<mark>revision</mark>" in results["faith-experiments-intro"]["snippet"]
+
+    def test_preview_index_holds_only_visible_text(self, run_with_db):
+        """Test the Mongo backend's post_previews documents never contain gated text"""
+        from services.post_search import PREVIEW_COLLECTION, PostSearch
+
+        search = PostSearch("mongo")
+
+        async def scenario(db):
+            await db.posts.insert_many([
+                search_post("gated", PREVIEW_FILLER + " lantern", premium=True),
+                search_post("free", PREVIEW_FILLER + " lantern", premium=False),
+                search_post("deleted", "lantern"),
+            ])
+            await search.sync_previews(db)
+            await db.posts.delete_one({"id": "deleted"})
+            await search.remove_post(db, "deleted")
+            await search.index_post(db, search_post("new", "<p>Shown &amp; lantern</p>"))
+            return {doc["id"]: doc for doc in await db[PREVIEW_COLLECTION].find({}, {"_id": 0}).to_list(None)}
+
+        previews = run_with_db(scenario)
+        assert sorted(previews) == ["free", "gated", "new"]
+        assert "lantern" not in previews["gated"]["content"]
+        assert previews["free"]["content"].endswith("lantern")
+        assert previews["new"]["content"] == "Shown & lantern"
+
+    @pytest.mark.skipif(not os.environ.get("TEST_MONGODB_URI"), reason="$text needs a real MongoDB (TEST_MONGODB_URI)")
+    def test_mongo_ranking_ignores_gated_text(self, run_with_db):
+        """Test non-subscribers are matched and ranked on the preview alone, up to the limit"""
+        from services.post_search import PostSearch
+
+        search = PostSearch("mongo")
+        gated_hits = " lantern" * 60
+
+        async def scenario(db):
+            await db.posts.insert_many([
+                # One visible match, many gated ones
+                search_post("deep", "lantern " + PREVIEW_FILLER + gated_hits),
+                # Three visible matches, none gated
+                search_post("open", "lantern lantern lantern " + PREVIEW_FILLER),
+                # Gated matches only
+                search_post("hidden", PREVIEW_FILLER + gated_hits),
+            ])
+            await search.ensure_indexes(db)
+            reader = await search.search(db, "lantern", 2, is_subscribed=False)
+            subscriber = await search.search(db, "lantern", 3, is_subscribed=True)
+            return reader, subscriber
+
+        reader, subscriber = run_with_db(scenario)
+        assert [hit["id"] for hit in reader] == ["open", "deep"]
+        assert {hit["id"] for hit in subscriber} == {"open", "deep", "hidden"}
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,161 @@
+"""
+Tests for the notification transports, run in-process against offline providers:
+- email batches that the provider rejects are split so only bad messages fail
+- email templates escape per-message values and require every placeholder
+- the Twilio SMS transport, against a mocked Messages endpoint
+"""
+
+import asyncio
+import base64
+import sys
+from urllib.parse import parse_qs
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from services.email_dispatch import EmailDispatcher, FakeEmailProvider  # noqa: E402
+from services.email_templates import EmailTemplateEngine  # noqa: E402
+from services.sms_transport import SmsTransportError, TwilioSmsTransport  # noqa: E402
+
+
+class TestEmailDispatcher:
+    """Messages are sent in provider batches and each caller learns its own outcome"""
+
+    def test_invalid_address_fails_only_its_message(self):
+        """Test one invalid recipient does not fail the rest of its batch"""
+        provider = FakeEmailProvider(latency_seconds=0)
+        dispatcher = EmailDispatcher(provider, "sender@example.com", batch_size=8, max_delay_seconds=0.05)
+        recipients = [f"reader{i}@example.com" for i in range(7)]
+        recipients.insert(5, "not-an-address")
+
+        async def scenario():
+            results = await asyncio.gather(*[
+                dispatcher.send(to, "Subject", "<p>Body</p>") for to in recipients
+            ])
+            await dispatcher.aclose()
+            return results
+
+        results = asyncio.run(scenario())
+        assert results == [to != "not-an-address" for to in recipients]
+        assert sorted(message["to"][0] for message in provider.sent) == sorted(
+            to for to in recipients if to != "not-an-address"
+        )
+        stats = dispatcher.stats()
+        assert stats["batches"] == 1
+        assert stats["sent"] == 7 and stats["failed"] == 1
+        assert stats["split_batches"] == 3
+
+    def test_valid_batch_is_one_request(self):
+        """Test a batch without bad messages is sent in one provider call"""
+        provider = FakeEmailProvider(latency_seconds=0)
+        dispatcher = EmailDispatcher(provider, "sender@example.com", batch_size=4, max_delay_seconds=0.05)
+
+        async def scenario():
+            results = await asyncio.gather(*[
+                dispatcher.send(f"reader{i}@example.com", "Subject", "<p>Body</p>") for i in range(4)
+            ])
+            await dispatcher.aclose()
+            return results
+
+        assert asyncio.run(scenario()) == [True] * 4
+        assert dispatcher.stats()["split_batches"] == 0
+        assert len(provider.sent) == 4
+
+
+class TestEmailTemplates:
+    """Templates are compiled once and filled with escaped values"""
+
+    def test_values_are_escaped(self):
+        """Test markup in a user name is escaped wherever the placeholder appears"""
+        engine = EmailTemplateEngine()
+        html = engine.render("subscription_purchase", user_name="<b>Ann & Bo</b>", period_text="Yearly", amount="499")
+        assert "<b>Ann" not in html
+        assert "&lt;b&gt;Ann &amp; Bo&lt;/b&gt;" in html
+        assert "Yearly" in html and "499" in html
+        assert "$" + "user_name" not in html
+
+    def test_missing_value_raises(self):
+        """Test a render without every placeholder fails instead of sending a half-filled email"""
+        engine = EmailTemplateEngine()
+        with pytest.raises(KeyError):
+            engine.render("password_reset", user_name="Ann")
+
+
+def twilio_transport(handler, max_concurrency=10):
+    return TwilioSmsTransport(
+        "AC123", "token", max_concurrency=max_concurrency, http_transport=httpx.MockTransport(handler)
+    )
+
+
+def send_sms(transport, *messages):
+    async def scenario():
+        try:
+            return await asyncio.gather(
+                *[transport.send(to, "+15550000", body) for to, body in messages],
+                return_exceptions=True,
+            )
+        finally:
+            await transport.aclose()
+
+    return asyncio.run(scenario())
+
+
+class TestTwilioSmsTransport:
+    """SMS goes straight to the Twilio REST API over a pooled async client"""
+
+    def test_posts_message_form(self):
+        """Test a send is one authenticated form POST to the account's Messages resource"""
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(201, json={"sid": "SM42"})
+
+        transport = twilio_transport(handler)
+        assert send_sms(transport, ("+15551234", "Hello")) == ["SM42"]
+        request = requests_seen[0]
+        assert request.method == "POST"
+        assert str(request.url) == "https://api.twilio.com/2010-04-01/Accounts/AC123/Messages.json"
+        assert request.headers["authorization"] == "Basic " + base64.b64encode(b"AC123:token").decode()
+        assert parse_qs(request.content.decode()) == {"To": ["+15551234"], "From": ["+15550000"], "Body": ["Hello"]}
+        assert transport.stats()["sent"] == 1
+
+    def test_provider_and_network_errors(self):
+        """Test API errors and unreachable hosts both surface as SmsTransportError"""
+
+        def handler(request):
+            to = parse_qs(request.content.decode())["To"][0]
+            if to == "bad":
+                return httpx.Response(400, json={"message": "The 'To' number is not valid"})
+            raise httpx.ConnectError("connection refused", request=request)
+
+        transport = twilio_transport(handler)
+        rejected, unreachable = send_sms(transport, ("bad", "Hi"), ("+15551234", "Hi"))
+        assert isinstance(rejected, SmsTransportError)
+        assert "400" in str(rejected) and "not valid" in str(rejected)
+        assert isinstance(unreachable, SmsTransportError)
+        assert transport.stats()["failed"] == 2
+
+    def test_in_flight_sends_are_capped(self):
+        """Test no more than max_concurrency requests are outstanding at once"""
+        active, peak = 0, 0
+
+        async def handler(request):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return httpx.Response(201, json={"sid": "SM1"})
+
+        transport = twilio_transport(handler, max_concurrency=2)
+        results = send_sms(transport, *[(f"+1555000{i}", "Hi") for i in range(6)])
+        assert results == ["SM1"] * 6
+        assert peak == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,81 @@
+"""
+Tests for the bcrypt worker pool, run in-process:
+- calls beyond max_pending are rejected with 503 and Retry-After instead of queueing
+- the login endpoint surfaces that back-pressure to clients
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import FastAPI, HTTPException  # noqa: E402
+
+from routes import auth  # noqa: E402
+from services.password_hashing import PasswordHasher  # noqa: E402
+from utils.auth import hash_password  # noqa: E402
+
+
+class TestPasswordHasher:
+    """bcrypt runs on a bounded pool that sheds load once its queue is full"""
+
+    def test_rejects_beyond_max_pending(self):
+        """Test the call past max_pending gets a 503 while the others complete"""
+        hasher = PasswordHasher(workers=1, max_pending=2)
+
+        async def scenario():
+            results = await asyncio.gather(
+                *[hasher._run(time.sleep, 0.05) for _ in range(3)],
+                return_exceptions=True,
+            )
+            # Capacity is back once the queue drains
+            recovered = await hasher.verify("secret", hash_password("secret"))
+            return results, recovered
+
+        try:
+            results, recovered = asyncio.run(scenario())
+        finally:
+            hasher.shutdown()
+        rejected = [result for result in results if isinstance(result, HTTPException)]
+        assert len(rejected) == 1
+        assert rejected[0].status_code == 503
+        assert rejected[0].headers["Retry-After"] == "1"
+        assert recovered is True
+        stats = hasher.stats()
+        assert stats["rejected"] == 1
+        assert stats["max_pending_seen"] == 2
+        assert stats["pending"] == 0
+
+    def test_login_returns_503_when_saturated(self, run_with_db, monkeypatch):
+        """Test a login arriving at a full pool is answered with 503 and Retry-After"""
+        monkeypatch.setattr(auth, "password_hasher", PasswordHasher(workers=1, max_pending=0))
+        monkeypatch.setattr(auth, "_db", None)
+        app = FastAPI()
+        app.include_router(auth.router, prefix="/api")
+
+        async def scenario(db):
+            await db.users.insert_one({
+                "id": "u1",
+                "email": "busy@example.com",
+                "name": "Reader",
+                "password_hash": hash_password("secret123"),
+            })
+            auth.set_db(db)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(
+                    "/api/auth/login", json={"email": "busy@example.com", "password": "secret123"}
+                )
+
+        response = run_with_db(scenario)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
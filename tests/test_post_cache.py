@@ -0,0 +1,146 @@
+"""
+Tests for the in-process post catalog, run against a throwaway database:
+- each post revision is encoded once into full and preview bodies
+- reloading the catalog reuses the encoded bodies of unchanged posts
+- posts are found by id or slug, with the catalog's slug map only a hint
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from models.post import PREVIEW_LENGTH, build_preview  # noqa: E402
+from routes import posts as posts_routes  # noqa: E402
+from services.post_cache import PostCatalog, PostVariants, encode_listing  # noqa: E402
+
+LONG_CONTENT = "Faith tested in the ordinary hours of the day. " * 40
+
+
+def make_post(post_id, premium=True, content=LONG_CONTENT, updated_at="2024-01-01T00:00:00+00:00"):
+    return {
+        "id": post_id,
+        "title": f"Essay {post_id}",
+        "slug": f"essay-{post_id}",
+        "excerpt": "An essay.",
+        "content": content,
+        "is_premium": premium,
+        "created_at": "2024-01-01T00:00:00+00:00",
+        "updated_at": updated_at,
+    }
+
+
+class TestPostVariants:
+    """Full and preview bodies are built once per revision and picked per reader"""
+
+    def test_premium_post_has_preview_variant(self):
+        """Test non-subscribers get the truncated body, subscribers the full one"""
+        variants = PostVariants(make_post("p1"))
+        assert len(LONG_CONTENT) > PREVIEW_LENGTH
+        assert json.loads(variants.detail_json(True))["content"] == LONG_CONTENT
+        assert json.loads(variants.detail_json(False))["content"] == build_preview(LONG_CONTENT)
+        assert json.loads(variants.listing_json(False))["preview_content"] == build_preview(LONG_CONTENT)
+        assert variants.etag(True) != variants.etag(False)
+
+    def test_free_post_shares_one_body(self):
+        """Test a free post serves the same bytes and tag to every reader"""
+        variants = PostVariants(make_post("f1", premium=False))
+        assert variants.detail_json(False) is variants.detail_json(True)
+        assert variants.listing_json(False) is variants.listing_json(True)
+        assert variants.etag(False) == variants.etag(True)
+        assert json.loads(variants.detail_json(False))["content"] == LONG_CONTENT
+
+    def test_listing_joins_encoded_entries(self):
+        """Test a listing page is the entries' encoded bodies, with optional field projection"""
+        entries = [PostVariants(make_post("p1")), PostVariants(make_post("f1", premium=False))]
+        listing = json.loads(encode_listing(entries, is_subscribed=False))
+        assert [entry["id"] for entry in listing] == ["p1", "f1"]
+        assert listing[0]["preview_content"] == build_preview(LONG_CONTENT)
+        projected = json.loads(encode_listing(entries, is_subscribed=True, fields=["id", "title"]))
+        assert projected == [{"id": "p1", "title": "Essay p1"}, {"id": "f1", "title": "Essay f1"}]
+
+
+class TestPostCatalog:
+    """The catalog mirrors the posts collection and keeps encoded bodies across reloads"""
+
+    def test_reload_reuses_unchanged_variants(self, run_with_db):
+        """Test only the edited post is re-encoded when the catalog reloads"""
+        catalog = PostCatalog(ttl_seconds=60)
+
+        async def scenario(db):
+            await db.posts.insert_many([make_post("p1"), make_post("p2")])
+            _, before = await catalog.snapshot(db)
+            await db.posts.update_one(
+                {"id": "p2"},
+                {"$set": {"content": "Rewritten.", "updated_at": "2024-02-01T00:00:00+00:00"}},
+            )
+            catalog.invalidate()
+            _, after = await catalog.snapshot(db)
+            return {entry.post["id"]: entry for entry in before}, {entry.post["id"]: entry for entry in after}
+
+        before, after = run_with_db(scenario)
+        assert after["p1"] is before["p1"]
+        assert after["p2"] is not before["p2"]
+        assert json.loads(after["p2"].detail_json(True))["content"] == "Rewritten."
+
+
+class TestFindPost:
+    """GET /posts/{id_or_slug} resolves either key in one lookup"""
+
+    @pytest.fixture
+    def catalog(self, monkeypatch):
+        catalog = PostCatalog(ttl_seconds=60)
+        monkeypatch.setattr(posts_routes, "post_catalog", catalog)
+        return catalog
+
+    def test_finds_by_id_and_slug(self, catalog, run_with_db):
+        """Test a post is found by id or slug, whether or not the catalog is loaded"""
+
+        async def scenario(db):
+            await db.posts.insert_one(make_post("p1"))
+            cold = [await posts_routes.find_post(db, key) for key in ("p1", "essay-p1", "missing")]
+            await catalog.snapshot(db)
+            warm = [await posts_routes.find_post(db, key) for key in ("p1", "essay-p1", "missing")]
+            return cold, warm
+
+        for found in run_with_db(scenario):
+            assert [post and post["id"] for post in found] == ["p1", "p1", None]
+
+    def test_id_match_wins_over_slug(self, catalog, run_with_db):
+        """Test a key that is one post's id and another's slug returns the id match"""
+        by_id = make_post("clash")
+        by_slug = dict(make_post("p2"), slug="clash")
+
+        async def scenario(db):
+            await db.posts.insert_many([by_slug, by_id])
+            cold = await posts_routes.find_post(db, "clash")
+            await catalog.snapshot(db)
+            return cold, await posts_routes.find_post(db, "clash")
+
+        assert [post["id"] for post in run_with_db(scenario)] == ["clash", "clash"]
+
+    def test_stale_slug_hint_falls_back_to_database(self, catalog, run_with_db):
+        """Test a slug changed by another replica is still resolved, and the old one is not"""
+
+        async def scenario(db):
+            await db.posts.insert_one(make_post("p1"))
+            await catalog.snapshot(db)
+            # Renamed behind this process's back: its slug map still says essay-p1 -> p1
+            await db.posts.update_one({"id": "p1"}, {"$set": {"slug": "renamed"}})
+            return (
+                catalog.resolve_id("essay-p1"),
+                await posts_routes.find_post(db, "essay-p1"),
+                await posts_routes.find_post(db, "renamed"),
+            )
+
+        hint, old_slug, new_slug = run_with_db(scenario)
+        assert hint == "p1"
+        assert old_slug is None
+        assert new_slug["id"] == "p1"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
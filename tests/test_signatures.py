@@ -0,0 +1,80 @@
+"""
+Tests for local Razorpay signature verification (utils/signatures.py):
+- payment (Checkout) and webhook signatures: known-good, tampered, wrong length
+"""
+
+import pytest
+
+from utils.signatures import (
+    compute_payment_signature,
+    compute_webhook_signature,
+    verify_payment_signature,
+    verify_webhook_signature,
+)
+
+KEY_SECRET = "key_secret_test"
+WEBHOOK_SECRET = "webhook_secret_test"
+ORDER_ID = "order_IluGWxBm9U8zJ8"
+PAYMENT_ID = "pay_IluGWxBm9U8zJ9"
+BODY = b'{"event":"payment.captured","payload":{"payment":{"entity":{"id":"pay_IluGWxBm9U8zJ9"}}}}'
+# hmac.new(secret, message, sha256).hexdigest() for the values above
+PAYMENT_SIGNATURE = "7f0a70f9fb312ae9d0fe52597989a300cc1390e03db03015278fa69d5b7db257"
+WEBHOOK_SIGNATURE = "b63442ae2bded55d53520b84de0893b08cb82807dfa774966669525319acfb47"
+
+
+def flip_last(signature: str) -> str:
+    return signature[:-1] + ("0" if signature[-1] != "0" else "1")
+
+
+class TestPaymentSignature:
+    """HMAC-SHA256 of "<order_id>|<payment_id>" with the key secret"""
+
+    def test_known_good_signature(self):
+        """Test a signature matches the HMAC-SHA256 hex digest and verifies"""
+        signature = compute_payment_signature(ORDER_ID, PAYMENT_ID, KEY_SECRET)
+        assert signature == PAYMENT_SIGNATURE
+        assert verify_payment_signature(ORDER_ID, PAYMENT_ID, PAYMENT_SIGNATURE, KEY_SECRET)
+
+    def test_tampered_signature_and_fields(self):
+        """Test a changed signature, ids or secret are rejected"""
+        signature = compute_payment_signature(ORDER_ID, PAYMENT_ID, KEY_SECRET)
+        assert not verify_payment_signature(ORDER_ID, PAYMENT_ID, flip_last(signature), KEY_SECRET)
+        assert not verify_payment_signature(ORDER_ID, "pay_other", signature, KEY_SECRET)
+        assert not verify_payment_signature("order_other", PAYMENT_ID, signature, KEY_SECRET)
+        assert not verify_payment_signature(ORDER_ID, PAYMENT_ID, signature, "other_secret")
+
+    def test_wrong_length_and_empty(self):
+        """Test truncated, extended, empty and non-ASCII signatures are rejected without raising"""
+        signature = compute_payment_signature(ORDER_ID, PAYMENT_ID, KEY_SECRET)
+        for candidate in (signature[:-2], signature + "00", "", "é" * 64):
+            assert not verify_payment_signature(ORDER_ID, PAYMENT_ID, candidate, KEY_SECRET)
+        assert not verify_payment_signature(ORDER_ID, PAYMENT_ID, signature, "")
+
+
+class TestWebhookSignature:
+    """HMAC-SHA256 of the raw request body with the webhook secret"""
+
+    def test_known_good_signature(self):
+        """Test the signature of the exact body matches the HMAC-SHA256 hex digest and verifies"""
+        assert compute_webhook_signature(BODY, WEBHOOK_SECRET) == WEBHOOK_SIGNATURE
+        assert verify_webhook_signature(BODY, WEBHOOK_SIGNATURE, WEBHOOK_SECRET)
+
+    def test_tampered_signature_and_body(self):
+        """Test a changed signature, body, or secret is rejected"""
+        signature = compute_webhook_signature(BODY, WEBHOOK_SECRET)
+        assert not verify_webhook_signature(BODY, flip_last(signature), WEBHOOK_SECRET)
+        assert not verify_webhook_signature(BODY.replace(b"captured", b"failed"), signature, WEBHOOK_SECRET)
+        # Re-serialized JSON is a different body even if it parses the same
+        assert not verify_webhook_signature(BODY.replace(b":", b": "), signature, WEBHOOK_SECRET)
+        assert not verify_webhook_signature(BODY, signature, "other_secret")
+
+    def test_wrong_length_and_empty(self):
+        """Test truncated, extended, empty and non-ASCII signatures are rejected without raising"""
+        signature = compute_webhook_signature(BODY, WEBHOOK_SECRET)
+        for candidate in (signature[:32], signature + "ab", "", "é" * 64):
+            assert not verify_webhook_signature(BODY, candidate, WEBHOOK_SECRET)
+        assert not verify_webhook_signature(BODY, signature, "")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,74 @@
+"""
+Tests for serving /uploads, run in-process against a temporary upload directory:
+- servers with the pathsend extension get the file path instead of streamed chunks
+- other servers get the file in STATIC_CHUNK_BYTES reads
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from utils.compression import CompressionMiddleware  # noqa: E402
+from utils.http_cache import IMMUTABLE_CACHE_CONTROL  # noqa: E402
+from utils.static_files import STATIC_CHUNK_BYTES, ContentHashedStaticFiles  # noqa: E402
+
+HASHED_NAME = "c" * 64 + ".txt"
+
+
+def serve(directory: Path, extensions: dict):
+    """Send GET /<HASHED_NAME> through the middleware and return the ASGI messages."""
+    app = CompressionMiddleware(ContentHashedStaticFiles(directory=str(directory)), minimum_size=16)
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": f"/{HASHED_NAME}",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", b"gzip")],
+        "extensions": extensions,
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / HASHED_NAME
+    path.write_bytes(b"compressible text " * (STATIC_CHUNK_BYTES // 9))
+    return path
+
+
+class TestContentHashedStaticFiles:
+    """Content-hashed uploads are immutable and sent by the server when it can"""
+
+    def test_pathsend_passes_through_compression(self, upload):
+        """Test the path reaches the server unchanged even for a compressible type"""
+        start, body = serve(upload.parent, {"http.response.pathsend": {}})
+        assert body == {"type": "http.response.pathsend", "path": str(upload)}
+        headers = dict(start["headers"])
+        assert b"content-encoding" not in headers
+        assert headers[b"content-length"] == str(upload.stat().st_size).encode()
+        assert headers[b"cache-control"] == IMMUTABLE_CACHE_CONTROL.encode()
+
+    def test_streams_without_pathsend(self, upload):
+        """Test servers without the extension get the bytes in large chunks"""
+        messages = serve(upload.parent, {})
+        chunks = [message for message in messages if message["type"] == "http.response.body"]
+        assert all(message["type"] != "http.response.pathsend" for message in messages)
+        assert len(chunks) > 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])